@@ -12,6 +12,9 @@ from sqlalchemy import create_engine
 from alembic import context
 from app.core.config import settings
 from app.db.database import Base
+from app.models.idempotency import *
+from app.models.outbox import *
+from app.models.stats import *
 from app.models.task import *
 
 config = context.config
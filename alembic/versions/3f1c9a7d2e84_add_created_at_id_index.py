@@ -0,0 +1,37 @@
+"""Add created_at, id index for keyset pagination
+
+Revision ID: 3f1c9a7d2e84
+Revises: 633720ca971f
+Create Date: 2026-10-18 10:12:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2e84'
+down_revision: Union[str, None] = '633720ca971f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в tasks, но не работает внутри
+    # транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_task_created_at_id',
+            'tasks',
+            ['created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_task_created_at_id', table_name='tasks')
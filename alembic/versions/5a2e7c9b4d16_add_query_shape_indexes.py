@@ -0,0 +1,65 @@
+"""Add composite and partial indexes for list and worker queries
+
+Revision ID: 5a2e7c9b4d16
+Revises: e91b5f3a6c27
+Create Date: 2026-10-18 13:05:12.402771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a2e7c9b4d16'
+down_revision: Union[str, None] = 'e91b5f3a6c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("status IN ('NEW', 'PENDING', 'IN_PROGRESS')")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в большую таблицу, но не работает
+    # внутри транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_task_status_created_at_id',
+            'tasks',
+            ['status', 'created_at', 'id'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'idx_task_status_priority_created_at',
+            'tasks',
+            ['status', sa.text('priority DESC'), 'created_at'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'idx_task_active_created_at_id',
+            'tasks',
+            ['created_at', 'id'],
+            postgresql_where=ACTIVE,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'idx_task_active_priority_created_at',
+            'tasks',
+            [sa.text('priority DESC'), 'created_at'],
+            postgresql_where=ACTIVE,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'idx_task_status', table_name='tasks', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('idx_task_status', 'tasks', ['status'], unique=False)
+    op.drop_index('idx_task_active_priority_created_at', table_name='tasks')
+    op.drop_index('idx_task_active_created_at_id', table_name='tasks')
+    op.drop_index('idx_task_status_priority_created_at', table_name='tasks')
+    op.drop_index('idx_task_status_created_at_id', table_name='tasks')
@@ -0,0 +1,80 @@
+"""Add task counters and per-minute stats
+
+Revision ID: a3e7d1c5b820
+Revises: f4c8a2d6e913
+Create Date: 2026-10-18 17:24:51.206318
+
+Счётчики заполняются одним проходом по tasks и tasks_archive в shard 0;
+дальше их ведёт приложение в транзакциях создания и смены статуса.
+Поминутный ряд начинается с момента миграции.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e7d1c5b820'
+down_revision: Union[str, None] = 'f4c8a2d6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL = """
+INSERT INTO task_counters (name, priority, shard, value)
+SELECT name, priority, 0, sum(value)
+FROM (
+    SELECT status::text AS name, priority, count(*)::float8 AS value
+    FROM {table} GROUP BY status, priority
+    UNION ALL
+    SELECT 'wait_seconds', priority,
+           coalesce(sum(extract(epoch FROM started_at - created_at)), 0)
+    FROM {table} WHERE started_at IS NOT NULL GROUP BY priority
+    UNION ALL
+    SELECT 'wait_count', priority, count(*)
+    FROM {table} WHERE started_at IS NOT NULL GROUP BY priority
+    UNION ALL
+    SELECT 'run_seconds', priority,
+           coalesce(sum(extract(epoch FROM completed_at - started_at)), 0)
+    FROM {table} WHERE status = 'COMPLETED' AND started_at IS NOT NULL
+    GROUP BY priority
+    UNION ALL
+    SELECT 'run_count', priority, count(*)
+    FROM {table} WHERE status = 'COMPLETED' AND started_at IS NOT NULL
+    GROUP BY priority
+) counters
+GROUP BY name, priority
+ON CONFLICT (name, priority, shard)
+DO UPDATE SET value = task_counters.value + excluded.value
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    priority = postgresql.ENUM(name='taskpriority', create_type=False)
+    op.create_table(
+        'task_counters',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('priority', priority, nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Double(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('name', 'priority', 'shard'),
+    )
+    op.create_table(
+        'task_stats_minute',
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('priority', priority, nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('value', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('bucket', 'name', 'priority', 'shard'),
+    )
+    for table in ('tasks', 'tasks_archive'):
+        op.execute(BACKFILL.format(table=table))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_stats_minute')
+    op.drop_table('task_counters')
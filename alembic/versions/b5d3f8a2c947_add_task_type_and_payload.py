@@ -0,0 +1,34 @@
+"""Add task type and payload
+
+Revision ID: b5d3f8a2c947
+Revises: e2f7a9c4b136
+Create Date: 2026-10-18 20:41:27.305816
+
+Существующие задачи получают тип sleep — прежнее поведение воркера.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d3f8a2c947'
+down_revision: Union[str, None] = 'e2f7a9c4b136'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('tasks', 'tasks_archive'):
+        op.add_column(table, sa.Column('type', sa.String(length=64), server_default='sleep', nullable=False))
+        op.add_column(table, sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('tasks', 'tasks_archive'):
+        op.drop_column(table, 'payload')
+        op.drop_column(table, 'type')
@@ -0,0 +1,36 @@
+"""Add task retry columns and delayed outbox messages
+
+Revision ID: b7f2c4e9a1d3
+Revises: 5a2e7c9b4d16
+Create Date: 2026-10-18 14:20:41.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f2c4e9a1d3'
+down_revision: Union[str, None] = '5a2e7c9b4d16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tasks', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tasks', sa.Column('max_attempts', sa.Integer(), server_default='3', nullable=False))
+    op.add_column('task_outbox', sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.drop_index('idx_outbox_unsent', table_name='task_outbox', postgresql_where=sa.text('sent_at IS NULL'))
+    op.create_index('idx_outbox_unsent', 'task_outbox', ['available_at', 'id'], unique=False, postgresql_where=sa.text('sent_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_outbox_unsent', table_name='task_outbox', postgresql_where=sa.text('sent_at IS NULL'))
+    op.create_index('idx_outbox_unsent', 'task_outbox', ['id'], unique=False, postgresql_where=sa.text('sent_at IS NULL'))
+    op.drop_column('task_outbox', 'available_at')
+    op.drop_column('tasks', 'max_attempts')
+    op.drop_column('tasks', 'attempts')
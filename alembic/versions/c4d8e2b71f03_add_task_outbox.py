@@ -0,0 +1,39 @@
+"""Add task outbox
+
+Revision ID: c4d8e2b71f03
+Revises: 3f1c9a7d2e84
+Create Date: 2026-10-18 11:02:17.734092
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d8e2b71f03'
+down_revision: Union[str, None] = '3f1c9a7d2e84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('task_outbox',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('task_id', sa.UUID(), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_outbox_unsent', 'task_outbox', ['id'], unique=False, postgresql_where=sa.text('sent_at IS NULL'))
+    op.create_index('idx_outbox_sent_at', 'task_outbox', ['sent_at'], unique=False, postgresql_where=sa.text('sent_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_outbox_sent_at', table_name='task_outbox', postgresql_where=sa.text('sent_at IS NOT NULL'))
+    op.drop_index('idx_outbox_unsent', table_name='task_outbox', postgresql_where=sa.text('sent_at IS NULL'))
+    op.drop_table('task_outbox')
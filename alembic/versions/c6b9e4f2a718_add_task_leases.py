@@ -0,0 +1,70 @@
+"""Add task worker_id and lease_expires_at
+
+Revision ID: c6b9e4f2a718
+Revises: a3e7d1c5b820
+Create Date: 2026-10-18 18:05:17.448392
+
+Уже выполняющиеся задачи получают срок аренды now() + 5 минут: их
+воркеры ещё не продлевают аренду, и после этого срока задачи, оставшиеся
+IN_PROGRESS, заберёт reaper.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6b9e4f2a718'
+down_revision: Union[str, None] = 'a3e7d1c5b820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LEASE_INDEX = 'idx_task_lease_expires_at'
+IN_PROGRESS = sa.text("status = 'IN_PROGRESS'")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('tasks', 'tasks_archive'):
+        op.add_column(table, sa.Column('worker_id', sa.String(length=128), nullable=True))
+        op.add_column(table, sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute(
+        "UPDATE tasks SET lease_expires_at = now() + interval '5 minutes' "
+        "WHERE status = 'IN_PROGRESS'"
+    )
+
+    # tasks секционирована, а CONCURRENTLY на секционированной таблице не
+    # работает: индекс родителя создаётся ON ONLY, индекс каждой секции
+    # строится CONCURRENTLY и присоединяется к нему. Секции, созданные
+    # позже, получают индекс сами.
+    op.execute(
+        f'CREATE INDEX {LEASE_INDEX} ON ONLY tasks (lease_expires_at) '
+        f'WHERE {IN_PROGRESS}'
+    )
+    partitions = op.get_bind().execute(
+        sa.text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'tasks'::regclass ORDER BY c.relname"
+        )
+    ).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            name = f'{partition}_lease_expires_at_idx'
+            op.create_index(
+                name,
+                partition,
+                ['lease_expires_at'],
+                postgresql_where=IN_PROGRESS,
+                postgresql_concurrently=True,
+            )
+            op.execute(f'ALTER INDEX {LEASE_INDEX} ATTACH PARTITION {name}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(LEASE_INDEX, table_name='tasks')
+    for table in ('tasks_archive', 'tasks'):
+        op.drop_column(table, 'lease_expires_at')
+        op.drop_column(table, 'worker_id')
@@ -0,0 +1,206 @@
+"""Partition tasks by created_at and add tasks_archive
+
+Revision ID: d2a6f8c1b539
+Revises: b7f2c4e9a1d3
+Create Date: 2026-10-18 15:02:33.904127
+
+Существующая таблица не копируется: она переименовывается в
+tasks_legacy и присоединяется секцией FROM (MINVALUE) TO (<начало
+следующего месяца>). ATTACH один раз проверяет границу полным чтением
+tasks_legacy; дальше её архивирует app.services.partitions, как
+любую старую секцию. Первичный ключ tasks_legacy заменяется на
+(id, created_at) через индекс, построенный CONCURRENTLY, а остальные
+её индексы присоединяются к индексам родителя без перестроения.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a6f8c1b539'
+down_revision: Union[str, None] = 'b7f2c4e9a1d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+ACTIVE = sa.text("status IN ('NEW', 'PENDING', 'IN_PROGRESS')")
+TASK_INDEXES = (
+    ('idx_task_priority', ['priority'], None),
+    ('idx_task_created_at_id', ['created_at', 'id'], None),
+    ('idx_task_status_created_at_id', ['status', 'created_at', 'id'], None),
+    (
+        'idx_task_status_priority_created_at',
+        ['status', sa.text('priority DESC'), 'created_at'],
+        None,
+    ),
+    ('idx_task_active_created_at_id', ['created_at', 'id'], ACTIVE),
+    (
+        'idx_task_active_priority_created_at',
+        [sa.text('priority DESC'), 'created_at'],
+        ACTIVE,
+    ),
+)
+
+
+def task_columns() -> list[sa.Column]:
+    priority = postgresql.ENUM(name='taskpriority', create_type=False)
+    status = postgresql.ENUM(name='taskstatus', create_type=False)
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('priority', priority, nullable=False),
+        sa.Column('status', status, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('max_attempts', sa.Integer(), server_default='3', nullable=False),
+    ]
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def create_notify_trigger() -> None:
+    op.execute(
+        """
+        CREATE TRIGGER tasks_status_notify
+        AFTER UPDATE OF status ON tasks
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION notify_task_status()
+        """
+    )
+
+
+def create_task_indexes() -> None:
+    for name, columns, where in TASK_INDEXES:
+        op.create_index(name, 'tasks', columns, postgresql_where=where)
+
+
+def create_parent_index(name: str, columns: list, where) -> None:
+    """Индекс только на родителе tasks; секции присоединяются отдельно."""
+    sql = f"CREATE INDEX {name} ON ONLY tasks ({', '.join(map(str, columns))})"
+    if where is not None:
+        sql += f' WHERE {where}'
+    op.execute(sql)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.execute('DROP TRIGGER IF EXISTS tasks_status_notify ON tasks')
+    op.execute('UPDATE tasks SET created_at = now() WHERE created_at IS NULL')
+    op.alter_column('tasks', 'created_at', nullable=False)
+
+    # Первичный ключ секции должен совпадать с ключом родителя
+    # (id, created_at). Уникальный индекс строится без блокировки записи,
+    # затем одной командой заменяет прежний ключ по id.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'tasks_legacy_pkey',
+            'tasks',
+            ['id', 'created_at'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+    op.execute(
+        'ALTER TABLE tasks DROP CONSTRAINT tasks_pkey, '
+        'ADD CONSTRAINT tasks_legacy_pkey PRIMARY KEY USING INDEX '
+        'tasks_legacy_pkey'
+    )
+
+    # Старая таблица станет первой секцией, её индексы станут секциями
+    # индексов родителя.
+    op.rename_table('tasks', 'tasks_legacy')
+    for name, _, _ in TASK_INDEXES:
+        op.execute(f'ALTER INDEX {name} RENAME TO {name}_legacy')
+
+    op.create_table(
+        'tasks',
+        *task_columns(),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+
+    latest = bind.execute(
+        sa.text('SELECT greatest(now(), max(created_at)) FROM tasks_legacy')
+    ).scalar_one()
+    boundary = add_months(
+        latest.astimezone(timezone.utc).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        ),
+        1,
+    )
+    op.execute(
+        f"ALTER TABLE tasks ATTACH PARTITION tasks_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+    )
+    # Индексы родителя создаются ON ONLY, без построения по секциям, и
+    # собираются из готовых индексов tasks_legacy: ничего не строится под
+    # блокировкой. Новые секции ниже пустые, их индексы строятся сразу.
+    for name, columns, where in TASK_INDEXES:
+        create_parent_index(name, columns, where)
+        op.execute(f'ALTER INDEX {name} ATTACH PARTITION {name}_legacy')
+    for offset in range(MONTHS_AHEAD):
+        start = add_months(boundary, offset)
+        op.execute(
+            f"CREATE TABLE tasks_p{start:%Y_%m} PARTITION OF tasks "
+            f"FOR VALUES FROM ('{start.isoformat()}') "
+            f"TO ('{add_months(start, 1).isoformat()}')"
+        )
+    op.execute('CREATE TABLE tasks_default PARTITION OF tasks DEFAULT')
+    create_notify_trigger()
+
+    op.create_table(
+        'tasks_archive',
+        *task_columns(),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_task_archive_created_at_id', 'tasks_archive', ['created_at', 'id'], unique=False)
+    op.create_index('idx_task_archive_status_created_at_id', 'tasks_archive', ['status', 'created_at', 'id'], unique=False)
+    # lz4 сжимает крупные текстовые поля архива; без поддержки lz4 в
+    # сборке PostgreSQL остаётся pglz по умолчанию.
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            ALTER TABLE tasks_archive
+                ALTER COLUMN description SET COMPRESSION lz4,
+                ALTER COLUMN result SET COMPRESSION lz4,
+                ALTER COLUMN error SET COMPRESSION lz4;
+        EXCEPTION WHEN feature_not_supported OR invalid_parameter_value THEN
+            NULL;
+        END $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS tasks_status_notify ON tasks')
+    op.rename_table('tasks', 'tasks_partitioned')
+    for name, _, _ in TASK_INDEXES:
+        op.execute(f'ALTER INDEX {name} RENAME TO {name}_partitioned')
+
+    op.create_table('tasks', *task_columns(), sa.PrimaryKeyConstraint('id'))
+    op.execute('INSERT INTO tasks SELECT * FROM tasks_partitioned')
+    op.execute(
+        'INSERT INTO tasks SELECT * FROM tasks_archive '
+        'ON CONFLICT (id) DO NOTHING'
+    )
+    op.execute('DROP TABLE tasks_partitioned CASCADE')
+    op.drop_table('tasks_archive')
+
+    create_task_indexes()
+    op.alter_column('tasks', 'created_at', nullable=True)
+    create_notify_trigger()
@@ -0,0 +1,45 @@
+"""Add task idempotency keys
+
+Revision ID: e2f7a9c4b136
+Revises: c6b9e4f2a718
+Create Date: 2026-10-18 19:58:03.614027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f7a9c4b136'
+down_revision: Union[str, None] = 'c6b9e4f2a718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'task_idempotency_keys',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('task_id', sa.UUID(), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(
+        'idx_task_idempotency_keys_expires_at',
+        'task_idempotency_keys',
+        ['expires_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'idx_task_idempotency_keys_expires_at',
+        table_name='task_idempotency_keys',
+    )
+    op.drop_table('task_idempotency_keys')
@@ -0,0 +1,49 @@
+"""Add task status NOTIFY trigger
+
+Revision ID: e91b5f3a6c27
+Revises: c4d8e2b71f03
+Create Date: 2026-10-18 12:20:54.118263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b5f3a6c27'
+down_revision: Union[str, None] = 'c4d8e2b71f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_task_status() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'task_status', NEW.id::text || ':' || NEW.status::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tasks_status_notify
+        AFTER UPDATE OF status ON tasks
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION notify_task_status()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS tasks_status_notify ON tasks')
+    op.execute('DROP FUNCTION IF EXISTS notify_task_status()')
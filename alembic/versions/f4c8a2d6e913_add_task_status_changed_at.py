@@ -0,0 +1,33 @@
+"""Add task status_changed_at
+
+Revision ID: f4c8a2d6e913
+Revises: d2a6f8c1b539
+Create Date: 2026-10-18 16:11:08.530142
+
+Без заполнения старых строк: значение по умолчанию now() вычисляется
+один раз при ALTER (без перезаписи таблицы), поэтому для опросов с since
+раньше миграции старые задачи считаются изменёнными — это безопасно.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c8a2d6e913'
+down_revision: Union[str, None] = 'd2a6f8c1b539'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('tasks', 'tasks_archive'):
+        op.add_column(table, sa.Column('status_changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('tasks_archive', 'tasks'):
+        op.drop_column(table, 'status_changed_at')
@@ -0,0 +1,25 @@
+from app.brokers.base import Broker, BrokerMessage
+from app.core.config import settings
+
+_broker: Broker | None = None
+
+
+def get_broker() -> Broker:
+    """Брокер процесса, выбранный настройкой BROKER_BACKEND."""
+    global _broker
+
+    if _broker is None:
+        if settings.broker_backend == 'memory':
+            from app.brokers.memory import MemoryBroker
+
+            _broker = MemoryBroker()
+        else:
+            from app.brokers.rabbitmq import RabbitMQBroker
+
+            _broker = RabbitMQBroker(
+                settings.rabbitmq_url,
+                connection_pool_size=settings.broker_connection_pool_size,
+                channel_pool_size=settings.broker_channel_pool_size,
+            )
+
+    return _broker
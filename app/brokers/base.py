@@ -0,0 +1,84 @@
+import json
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Sequence
+
+QUEUE_NAME = 'tasks_queue'
+# Отдельная очередь на каждый приоритет (TaskPriority.numeric): порядок
+# между ними выбирает планировщик воркера, а не брокер.
+PRIORITY_QUEUES = {
+    3: f'{QUEUE_NAME}.high',
+    2: f'{QUEUE_NAME}.medium',
+    1: f'{QUEUE_NAME}.low',
+}
+# Сообщения, отклонённые без повтора (nack(requeue=False)).
+DEAD_LETTER_QUEUE = f'{QUEUE_NAME}.dead'
+
+
+def queue_for(priority: int) -> str:
+    return PRIORITY_QUEUES[min(max(priority, 1), 3)]
+
+
+def encode_task(task_id: str) -> bytes:
+    return json.dumps({'task_id': task_id}).encode()
+
+
+class BrokerMessage(ABC):
+    """Полученное сообщение о задаче."""
+
+    body: bytes
+    priority: int
+    # delivery_tag уникален и ack(multiple=True) действует в пределах queue
+    queue: str
+    delivery_tag: int
+    # момент публикации, unix time
+    timestamp: float
+
+    @abstractmethod
+    async def ack(self, multiple: bool = False):
+        ...
+
+    @abstractmethod
+    async def nack(self, requeue: bool = True):
+        ...
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False):
+        """ack при успешном выходе, nack при исключении (как в aio_pika)."""
+        try:
+            yield self
+        except Exception:
+            await self.nack(requeue=requeue)
+            raise
+        else:
+            await self.ack()
+
+
+class Broker(ABC):
+    """Очереди задач по приоритетам (PRIORITY_QUEUES)."""
+
+    async def connect(self, channels: int = 1):
+        """Готовит брокер к работе, открывая channels каналов заранее."""
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, task_id: str, priority: int):
+        ...
+
+    @abstractmethod
+    async def publish_batch(
+        self, tasks: Sequence[tuple[str, int]]
+    ) -> list[Exception | None]:
+        """Публикует пачку, возвращает ошибку (или None) на каждую задачу."""
+
+    @abstractmethod
+    def consume(
+        self, prefetch: int, queue: str
+    ) -> AsyncIterator[BrokerMessage]:
+        """Сообщения из queue, не больше prefetch неподтверждённых."""
+
+    @abstractmethod
+    async def queue_depth(self, queue: str | None = None) -> int:
+        """Готовые сообщения в queue; None — во всех очередях приоритетов."""
@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Sequence
+
+from app.brokers.base import (
+    DEAD_LETTER_QUEUE,
+    PRIORITY_QUEUES,
+    Broker,
+    BrokerMessage,
+    encode_task,
+    queue_for,
+)
+
+
+class MemoryMessage(BrokerMessage):
+    def __init__(
+        self,
+        consumer: '_Consumer',
+        body: bytes,
+        priority: int,
+        timestamp: float,
+        delivery_tag: int,
+    ):
+        self.consumer = consumer
+        self.body = body
+        self.priority = priority
+        self.queue = consumer.queue
+        self.timestamp = timestamp
+        self.delivery_tag = delivery_tag
+
+    async def ack(self, multiple: bool = False):
+        self.consumer.settle(self.delivery_tag, multiple)
+
+    async def nack(self, requeue: bool = True):
+        self.consumer.settle(self.delivery_tag, multiple=False)
+        if requeue:
+            self.consumer.broker.put(self.body, self.priority, self.timestamp)
+        else:
+            self.consumer.broker.dead_letters.append(self.body)
+
+
+class _Consumer:
+    def __init__(self, broker: 'MemoryBroker', queue: str, prefetch: int):
+        self.broker = broker
+        self.queue = queue
+        self.slots = asyncio.Semaphore(prefetch)
+        self.unacked: OrderedDict[int, MemoryMessage] = OrderedDict()
+        self._tags = itertools.count(1)
+
+    def deliver(
+        self, body: bytes, priority: int, timestamp: float
+    ) -> MemoryMessage:
+        message = MemoryMessage(
+            self, body, priority, timestamp, next(self._tags)
+        )
+        self.unacked[message.delivery_tag] = message
+        return message
+
+    def settle(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            tags = [tag for tag in self.unacked if tag <= delivery_tag]
+        else:
+            tags = [delivery_tag] if delivery_tag in self.unacked else []
+        for tag in tags:
+            del self.unacked[tag]
+            self.slots.release()
+
+
+class MemoryBroker(Broker):
+    """Брокер на очередях asyncio в пределах одного процесса.
+
+    Для тестов, бенчмарков и развёртывания на одной машине без AMQP.
+    Сообщения не переживают перезапуск процесса: источником истины
+    остаётся outbox в базе.
+    """
+
+    def __init__(self, dead_letter_size: int = 10000):
+        self._queues: dict[str, asyncio.Queue] | None = None
+        self.dead_letters: deque[bytes] = deque(maxlen=dead_letter_size)
+
+    @property
+    def queues(self) -> dict[str, asyncio.Queue]:
+        # создаются в работающем цикле событий, а не при импорте
+        if self._queues is None:
+            self._queues = {
+                name: asyncio.Queue() for name in PRIORITY_QUEUES.values()
+            }
+        return self._queues
+
+    def put(self, body: bytes, priority: int, timestamp: float | None = None):
+        self.queues[queue_for(priority)].put_nowait(
+            (priority, timestamp or time.time(), body)
+        )
+
+    async def publish(self, task_id: str, priority: int):
+        self.put(encode_task(task_id), priority)
+
+    async def publish_batch(
+        self, tasks: Sequence[tuple[str, int]]
+    ) -> list[Exception | None]:
+        for task_id, priority in tasks:
+            self.put(encode_task(task_id), priority)
+
+        return [None] * len(tasks)
+
+    async def consume(
+        self, prefetch: int, queue: str
+    ) -> AsyncIterator[MemoryMessage]:
+        consumer = _Consumer(self, queue, prefetch)
+        while True:
+            await consumer.slots.acquire()
+            priority, timestamp, body = await self.queues[queue].get()
+            yield consumer.deliver(body, priority, timestamp)
+
+    async def queue_depth(self, queue: str | None = None) -> int:
+        if queue == DEAD_LETTER_QUEUE:
+            return len(self.dead_letters)
+        if queue is None:
+            return sum(q.qsize() for q in self.queues.values())
+        return self.queues[queue].qsize()
@@ -0,0 +1,197 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import AsyncIterator, Sequence
+
+import aio_pika
+from aio_pika.pool import Pool
+
+from app.brokers.base import (
+    DEAD_LETTER_QUEUE,
+    PRIORITY_QUEUES,
+    Broker,
+    BrokerMessage,
+    encode_task,
+    queue_for,
+)
+from app.core.metrics import BROKER_CHANNELS_IN_USE, BROKER_CHANNELS_OPENED
+
+
+class RabbitMQMessage(BrokerMessage):
+    def __init__(
+        self, message: aio_pika.abc.AbstractIncomingMessage, queue: str
+    ):
+        self.message = message
+        self.queue = queue
+        self.body = message.body
+        self.priority = message.priority or 0
+        self.delivery_tag = message.delivery_tag
+        self.timestamp = (
+            message.timestamp.timestamp() if message.timestamp else time.time()
+        )
+
+    async def ack(self, multiple: bool = False):
+        await self.message.ack(multiple=multiple)
+
+    async def nack(self, requeue: bool = True):
+        await self.message.nack(requeue=requeue)
+
+
+class RabbitMQBroker(Broker):
+    """RabbitMQ: пул соединений, поверх него пул каналов с подтверждениями.
+
+    Топология объявляется один раз, публикация не открывает каналов и не
+    повторяет declare_queue.
+    """
+
+    def __init__(
+        self, url: str, connection_pool_size: int, channel_pool_size: int
+    ):
+        self.url = url
+        self.connection_pool_size = connection_pool_size
+        self.channel_pool_size = channel_pool_size
+        self._connection_pool: Pool | None = None
+        self._channel_pool: Pool | None = None
+        self._topology_declared = False
+
+    async def _get_connection(self) -> aio_pika.abc.AbstractRobustConnection:
+        return await aio_pika.connect_robust(self.url)
+
+    async def _get_channel(self) -> aio_pika.abc.AbstractChannel:
+        async with self.connection_pool.acquire() as connection:
+            channel = await connection.channel(publisher_confirms=True)
+            BROKER_CHANNELS_OPENED.inc()
+
+        if not self._topology_declared:
+            await self.declare_topology(channel)
+
+        return channel
+
+    @property
+    def connection_pool(self) -> Pool:
+        if self._connection_pool is None:
+            self._connection_pool = Pool(
+                self._get_connection, max_size=self.connection_pool_size
+            )
+        return self._connection_pool
+
+    @property
+    def channel_pool(self) -> Pool:
+        if self._channel_pool is None:
+            self._channel_pool = Pool(
+                self._get_channel, max_size=self.channel_pool_size
+            )
+        return self._channel_pool
+
+    async def declare_topology(
+        self, channel: aio_pika.abc.AbstractChannel
+    ) -> dict[str, aio_pika.abc.AbstractQueue]:
+        await channel.declare_queue(DEAD_LETTER_QUEUE, durable=True)
+        queues = {
+            name: await channel.declare_queue(
+                name,
+                durable=True,
+                arguments={
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': DEAD_LETTER_QUEUE,
+                },
+            )
+            for name in PRIORITY_QUEUES.values()
+        }
+        self._topology_declared = True
+
+        return queues
+
+    async def connect(self, channels: int = 1):
+        """Объявляет топологию и заранее открывает channels каналов.
+
+        Каналы берутся из пула одновременно, поэтому открываются разные
+        (и под них соединения пула); после возврата они остаются в пуле.
+        """
+        channels = max(1, min(channels, self.channel_pool_size))
+        async with AsyncExitStack() as stack:
+            results = await asyncio.gather(
+                *(
+                    stack.enter_async_context(self.channel_pool.acquire())
+                    for _ in range(channels)
+                ),
+                return_exceptions=True,
+            )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == channels:
+            raise errors[0]
+
+    async def close(self):
+        if self._channel_pool is not None:
+            await self._channel_pool.close()
+        if self._connection_pool is not None:
+            await self._connection_pool.close()
+
+    @staticmethod
+    def build_message(task_id: str, priority: int) -> aio_pika.Message:
+        return aio_pika.Message(
+            body=encode_task(task_id),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            priority=priority,
+            # по нему планировщик воркера поднимает приоритет старых задач
+            timestamp=datetime.now(timezone.utc),
+        )
+
+    async def publish(self, task_id: str, priority: int):
+        with BROKER_CHANNELS_IN_USE.track_inprogress():
+            async with self.channel_pool.acquire() as channel:
+                await channel.default_exchange.publish(
+                    self.build_message(task_id, priority),
+                    routing_key=queue_for(priority),
+                )
+
+    async def publish_batch(
+        self, tasks: Sequence[tuple[str, int]]
+    ) -> list[Exception | None]:
+        """Публикация пачки через один канал с подтверждениями.
+
+        Сообщения отправляются без ожидания друг друга, подтверждения
+        брокера собираются одним gather.
+        """
+        with BROKER_CHANNELS_IN_USE.track_inprogress():
+            async with self.channel_pool.acquire() as channel:
+                results = await asyncio.gather(
+                    *(
+                        channel.default_exchange.publish(
+                            self.build_message(task_id, priority),
+                            routing_key=queue_for(priority),
+                        )
+                        for task_id, priority in tasks
+                    ),
+                    return_exceptions=True,
+                )
+
+        return [r if isinstance(r, Exception) else None for r in results]
+
+    async def consume(
+        self, prefetch: int, queue: str
+    ) -> AsyncIterator[RabbitMQMessage]:
+        connection = await aio_pika.connect_robust(self.url)
+        try:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=prefetch)
+            queues = await self.declare_topology(channel)
+
+            async with queues[queue].iterator() as queue_iter:
+                async for message in queue_iter:
+                    yield RabbitMQMessage(message, queue)
+        finally:
+            await connection.close()
+
+    async def queue_depth(self, queue: str | None = None) -> int:
+        names = [queue] if queue else PRIORITY_QUEUES.values()
+        depth = 0
+        async with self.connection_pool.acquire() as connection:
+            # отдельный канал: ошибка passive declare закрывает канал
+            async with connection.channel() as channel:
+                for name in names:
+                    declared = await channel.declare_queue(name, passive=True)
+                    depth += declared.declaration_result.message_count
+
+        return depth
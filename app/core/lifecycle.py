@@ -0,0 +1,83 @@
+"""Учёт выполняющихся операций для плавной остановки процесса."""
+import asyncio
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import Gauge
+
+from app.core.metrics import HTTP_REQUESTS_IN_FLIGHT, PUBLISHES_IN_FLIGHT
+
+
+class InFlight:
+    """Счётчик операций; drain ждёт, пока все начатые завершатся."""
+
+    def __init__(self, gauge: Gauge):
+        self.gauge = gauge
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        self.count += 1
+        self.gauge.inc()
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.count -= 1
+            self.gauge.dec()
+            if not self.count:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """False, если за timeout секунд операции не завершились."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+http_requests = InFlight(HTTP_REQUESTS_IN_FLIGHT)
+publishes = InFlight(PUBLISHES_IN_FLIGHT)
+
+
+def on_exit_signal(callback: Callable[[], None]):
+    """Вызывает callback в цикле событий по SIGTERM/SIGINT.
+
+    Обработчик встаёт перед обработчиком сервера: uvicorn по сигналу
+    сначала ждёт открытые соединения и только потом запускает остановку
+    lifespan, а callback выполняется сразу.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            # сервер сигнал не перехватывает, поведение не меняем
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(callback)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+class InFlightMiddleware:
+    """ASGI middleware, учитывающий HTTP-запросы в http_requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with http_requests.track():
+            await self.app(scope, receive, send)
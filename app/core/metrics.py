@@ -0,0 +1,152 @@
+import functools
+import time
+from typing import Any, Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Время задачи в очереди и выполнения — от секунд до часов.
+TASK_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route.',
+    ['method', 'route', 'status'],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled.'
+)
+PUBLISHES_IN_FLIGHT = Gauge(
+    'outbox_publishes_in_flight', 'Outbox batches being published.'
+)
+REPOSITORY_CALL_DURATION = Histogram(
+    'repository_call_duration_seconds',
+    'Latency of repository methods.',
+    ['repository', 'method'],
+)
+BROKER_CHANNELS_IN_USE = Gauge(
+    'broker_channels_in_use', 'Pooled AMQP channels currently borrowed.'
+)
+BROKER_CHANNELS_OPENED = Counter(
+    'broker_channels_opened_total', 'AMQP channels opened by the pool.'
+)
+BROKER_QUEUE_DEPTH = Gauge(
+    'broker_queue_depth', 'Messages ready in the broker queue.', ['queue']
+)
+WORKER_TASKS_IN_FLIGHT = Gauge(
+    'worker_tasks_in_flight', 'Tasks currently executed by this worker.'
+)
+SCHEDULER_BUFFERED = Gauge(
+    'worker_scheduler_buffered',
+    'Messages prefetched by the worker and waiting for a slot.',
+    ['priority'],
+)
+SCHEDULER_WAIT = Histogram(
+    'worker_scheduler_wait_seconds',
+    'Time from publish to dispatch by the worker scheduler.',
+    ['priority'],
+    buckets=TASK_BUCKETS,
+)
+TASK_QUEUE_WAIT = Histogram(
+    'task_queue_wait_seconds',
+    'Time from created_at to started_at.',
+    ['priority'],
+    buckets=TASK_BUCKETS,
+)
+TASK_EXECUTION = Histogram(
+    'task_execution_seconds',
+    'Time from started_at to completed_at.',
+    ['priority'],
+    buckets=TASK_BUCKETS,
+)
+
+
+def timed(repository: str):
+    """Замеряет длительность async-метода репозитория.
+
+    Дочерняя метрика с метками создаётся один раз при декорировании,
+    так что на вызов приходится только perf_counter и observe.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        histogram = REPOSITORY_CALL_DURATION.labels(repository, func.__name__)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware с гистограммой запросов по шаблону маршрута."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUEST_DURATION.labels(
+                scope['method'], route, status_code
+            ).observe(time.perf_counter() - start)
+
+
+class DatabasePoolCollector:
+    """Состояние пула соединений SQLAlchemy на момент сбора метрик.
+
+    До создания движка пул пуст и все значения нулевые.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def collect(self):
+        pool = getattr(self.database.engine, 'pool', None)
+        for name, description, getter in (
+            ('db_pool_size', 'Configured pool size.', 'size'),
+            ('db_pool_checked_out', 'Connections in use.', 'checkedout'),
+            ('db_pool_checked_in', 'Idle pooled connections.', 'checkedin'),
+            ('db_pool_overflow', 'Connections above pool_size.', 'overflow'),
+        ):
+            if pool is None:
+                yield GaugeMetricFamily(name, description, value=0)
+            elif hasattr(pool, getter):
+                yield GaugeMetricFamily(
+                    name, description, value=getattr(pool, getter)()
+                )
+
+
+class StatsCollector:
+    """Отдаёт словарь счётчиков (например, статистику кэша) как gauge."""
+
+    def __init__(self, prefix: str, stats: Callable[[], dict[str, Any]]):
+        self.prefix = prefix
+        self.stats = stats
+
+    def collect(self):
+        for key, value in self.stats().items():
+            yield GaugeMetricFamily(
+                f'{self.prefix}_{key}', f'{self.prefix} {key}', value=value
+            )
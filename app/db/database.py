@@ -1,5 +1,9 @@
-from sqlalchemy import create_engine
+import asyncio
+
+from prometheus_client import REGISTRY
+from sqlalchemy import make_url
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
@@ -7,21 +11,83 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import settings
+from app.core.logger import logger
+from app.core.metrics import DatabasePoolCollector
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(
-    str(settings.database_url),
-    pool_size=20,
-    max_overflow=10,
-    pool_pre_ping=True,
-)
+class Database:
+    """Async-движок процесса.
 
-AsyncSessionLocal = async_sessionmaker(
-    bind=engine, expire_on_commit=False, autoflush=False, class_=AsyncSession
-)
+    Создаётся явно при старте процесса (lifespan API, main воркера), а не
+    при импорте модуля; если старт его не создал, движок создаётся при
+    первой сессии.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine: AsyncEngine | None = None
+        self.sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
+    def connect(self) -> AsyncEngine:
+        if self.engine is None:
+            connect_args = {}
+            if make_url(self.url).drivername == 'postgresql+asyncpg':
+                # подготовленные выражения asyncpg кэшируются на
+                # соединении: повторный запрос не разбирается заново
+                connect_args['prepared_statement_cache_size'] = (
+                    settings.db_statement_cache_size
+                )
+            self.engine = create_async_engine(
+                self.url,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_pre_ping=True,
+                connect_args=connect_args,
+            )
+            self.sessionmaker = async_sessionmaker(
+                bind=self.engine,
+                expire_on_commit=False,
+                autoflush=False,
+                class_=AsyncSession,
+            )
+
+        return self.engine
+
+    async def warm_up(self, connections: int) -> int:
+        """Заранее открывает до connections соединений пула."""
+        engine = self.connect()
+        results = await asyncio.gather(
+            *(
+                engine.connect().start()
+                for _ in range(min(connections, settings.db_pool_size))
+            ),
+            return_exceptions=True,
+        )
+        opened = [r for r in results if not isinstance(r, BaseException)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        # соединения возвращаются в пул и остаются в нём открытыми
+        await asyncio.gather(*(connection.close() for connection in opened))
+        if errors:
+            logger.error(
+                f'Failed to pre-warm {len(errors)} DB connections: '
+                f'{str(errors[0])}'
+            )
+
+        return len(opened)
+
+    def session(self) -> AsyncSession:
+        self.connect()
+        return self.sessionmaker()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+database = Database(settings.database_url)
 
-sync_engine = create_engine(str(settings.sync_database_url))
+REGISTRY.register(DatabasePoolCollector(database))
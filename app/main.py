@@ -1,11 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_pagination import add_pagination
 
+from app.brokers import get_broker
 from app.core.config import settings
-from app.routers import tasks
+from app.core.logger import logger
+from app.core.lifecycle import InFlightMiddleware, on_exit_signal, publishes
+from app.core.metrics import MetricsMiddleware
+from app.db.database import database
+from app.routers import system, tasks
+from app.services import outbox_relay, worker
+from app.services.handlers import handlers
+from app.services.notifications import get_notification_backend
+from app.services.task_events import task_events
+
+
+def start_embedded_workers() -> list[asyncio.Task]:
+    """Релей outbox и воркер внутри процесса API (брокер в памяти)."""
+    return [
+        asyncio.create_task(outbox_relay.main()),
+        asyncio.create_task(
+            worker.consume(
+                get_broker(),
+                settings.worker_concurrency,
+                settings.worker_batch_size,
+            )
+        ),
+    ]
+
+
+async def drain():
+    """Дожидается начатой публикации outbox перед остановкой.
+
+    Начатые запросы дожидается сам uvicorn (--timeout-graceful-shutdown)
+    до остановки lifespan.
+    """
+    timeout = settings.shutdown_drain_timeout
+    if not await publishes.drain(timeout):
+        logger.warning(f'Outbox publish still running after {timeout}s')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пулы создаются и прогреваются до приёма запросов, чтобы первые
+    # запросы после выката не платили за установку соединений.
+    database.connect()
+    broker = get_broker()
+    warmed, broker_error = await asyncio.gather(
+        database.warm_up(settings.db_pool_warmup),
+        broker.connect(settings.broker_channel_warmup),
+        return_exceptions=True,
+    )
+    if isinstance(warmed, BaseException):
+        logger.error(f'Failed to pre-warm DB pool: {str(warmed)}')
+    if broker_error is not None:
+        logger.error(f'Failed to declare broker topology: {str(broker_error)}')
 
-app = FastAPI(title=settings.project_name)
+    notifications = get_notification_backend()
+    await notifications.start()
+
+    embedded = []
+    if settings.broker_backend == 'memory':
+        embedded = start_embedded_workers()
+
+    # Long-poll и SSE завершаются по сигналу остановки, до того как
+    # uvicorn начнёт ждать открытые соединения.
+    on_exit_signal(task_events.close)
+
+    yield
+
+    # если сигнала не было (остановка не через uvicorn)
+    task_events.close()
+    await drain()
+    for task in embedded:
+        task.cancel()
+    await asyncio.gather(*embedded, return_exceptions=True)
+    await notifications.stop()
+    await broker.close()
+    await database.dispose()
+    handlers.shutdown()
+
+
+app = FastAPI(title=settings.project_name, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,8 +91,9 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=['*'],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(InFlightMiddleware)
 
 
 app.include_router(tasks.router)
-
-add_pagination(app)
+app.include_router(system.router)
@@ -1 +1,4 @@
-from .task import Task
+from .idempotency import TaskIdempotencyKey
+from .outbox import OutboxMessage
+from .stats import TaskCounter, TaskStatsMinute
+from .task import ArchivedTask, Task
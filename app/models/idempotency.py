@@ -0,0 +1,25 @@
+from sqlalchemy import Column, DateTime, Index, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.database import Base
+
+
+class TaskIdempotencyKey(Base):
+    """Ключ Idempotency-Key запроса на создание задачи.
+
+    Отдельная таблица, а не колонка tasks: уникальный индекс
+    секционированной таблицы обязан включать created_at, а ключ должен
+    быть уникален глобально.
+    """
+
+    __tablename__ = 'task_idempotency_keys'
+
+    key = Column(String(255), primary_key=True)
+    task_id = Column(UUID(as_uuid=True), nullable=False)
+    # sha256 тела запроса: тот же ключ с другим телом — ошибка клиента
+    fingerprint = Column(String(64), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('idx_task_idempotency_keys_expires_at', 'expires_at'),
+    )
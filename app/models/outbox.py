@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.database import Base
+
+
+class OutboxMessage(Base):
+    """Сообщение о задаче, ожидающее публикации в брокер."""
+
+    __tablename__ = 'task_outbox'
+
+    id = Column(
+        BigInteger().with_variant(Integer, 'sqlite'),
+        primary_key=True,
+        autoincrement=True,
+    )
+    task_id = Column(UUID(as_uuid=True), nullable=False)
+    priority = Column(Integer, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+    # Отложенная публикация (повтор с backoff): релей не берёт сообщение
+    # раньше этого момента.
+    available_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            'idx_outbox_unsent',
+            'available_at',
+            'id',
+            postgresql_where=text('sent_at IS NULL'),
+        ),
+        Index(
+            'idx_outbox_sent_at',
+            'sent_at',
+            postgresql_where=text('sent_at IS NOT NULL'),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, task_id={self.task_id}, sent_at={self.sent_at})>"
@@ -0,0 +1,48 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Double,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+)
+from sqlalchemy.types import Enum as SqlEnum
+
+from app.db.database import Base
+from app.models.task import TaskPriority
+
+
+class TaskCounter(Base):
+    """Накопительные счётчики задач по приоритету.
+
+    name — статус (число задач в нём) или сумма/число замеров
+    ожидания и выполнения. Каждый счётчик разбит на shard строк, чтобы
+    параллельные транзакции не ждали блокировку одной строки; значение —
+    сумма по shard.
+    """
+
+    __tablename__ = 'task_counters'
+
+    name = Column(String(32), nullable=False)
+    priority = Column(SqlEnum(TaskPriority), nullable=False)
+    shard = Column(Integer, nullable=False)
+    value = Column(Double, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (PrimaryKeyConstraint('name', 'priority', 'shard'),)
+
+
+class TaskStatsMinute(Base):
+    """Поминутные события (создание и переходы статусов) для графиков."""
+
+    __tablename__ = 'task_stats_minute'
+
+    bucket = Column(DateTime(timezone=True), nullable=False)
+    name = Column(String(32), nullable=False)
+    priority = Column(SqlEnum(TaskPriority), nullable=False)
+    shard = Column(Integer, nullable=False)
+    value = Column(BigInteger, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        PrimaryKeyConstraint('bucket', 'name', 'priority', 'shard'),
+    )
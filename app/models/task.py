@@ -2,8 +2,21 @@ import uuid
 from datetime import datetime, timezone
 from enum import Enum as PyEnum
 
-from sqlalchemy import Column, DateTime, Index, String, Text, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    DDL,
+    JSON,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    Text,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.types import Enum as SqlEnum
 
@@ -19,6 +32,19 @@ class TaskStatus(str, PyEnum):
     CANCELLED = 'CANCELLED'
 
 
+TERMINAL_STATUSES = frozenset(
+    {TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED}
+)
+
+
+ACTIVE_STATUSES = (TaskStatus.NEW, TaskStatus.PENDING, TaskStatus.IN_PROGRESS)
+ACTIVE_STATUSES_CLAUSE = text("status IN ('NEW', 'PENDING', 'IN_PROGRESS')")
+IN_PROGRESS_CLAUSE = text("status = 'IN_PROGRESS'")
+
+# обработчик задач, созданных без type (см. app.services.handlers)
+DEFAULT_TASK_TYPE = 'sleep'
+
+
 class TaskPriority(str, PyEnum):
     LOW = 'LOW'
     MEDIUM = 'MEDIUM'
@@ -29,12 +55,26 @@ class TaskPriority(str, PyEnum):
         return {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}[self.value]
 
 
-class Task(Base):
-    __tablename__ = 'tasks'
+class TaskColumns:
+    """Колонки задачи, общие для горячей и архивной таблиц."""
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # первичный ключ задаётся в __table_args__ каждой таблицы
+    id = Column(UUID(as_uuid=True), nullable=False, default=uuid.uuid4)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
+    # обработчик из реестра app.services.handlers и его входные данные
+    type = Column(
+        String(64),
+        nullable=False,
+        default=DEFAULT_TASK_TYPE,
+        server_default=DEFAULT_TASK_TYPE,
+    )
+    payload = Column(
+        JSON(none_as_null=True).with_variant(
+            JSONB(none_as_null=True), 'postgresql'
+        ),
+        nullable=True,
+    )
     priority: Mapped[TaskPriority] = mapped_column(
         SqlEnum(TaskPriority), default=TaskPriority.MEDIUM
     )
@@ -43,6 +83,13 @@ class Task(Base):
     )
     created_at = Column(
         DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+    status_changed_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
         default=lambda: datetime.now(timezone.utc),
         server_default=func.now(),
     )
@@ -50,14 +97,89 @@ class Task(Base):
     completed_at = Column(DateTime(timezone=True), nullable=True)
     result = Column(Text, nullable=True)
     error = Column(Text, nullable=True)
-
-    __table_args__ = (
-        Index('idx_task_status', 'status'),
-        Index('idx_task_priority', 'priority'),
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    max_attempts = Column(
+        Integer, nullable=False, default=3, server_default='3'
     )
+    # воркер, взявший задачу, и срок его аренды: пока задача
+    # IN_PROGRESS, воркер продлевает срок, просроченную забирает reaper
+    worker_id = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
 
     def __repr__(self):
-        return f"<Task(id={self.id}, name={self.name}, status={self.status}, priority={self.priority})>"
+        return f"<{type(self).__name__}(id={self.id}, name={self.name}, status={self.status}, priority={self.priority})>"
 
     def __str__(self):
         return f"Task '{self.name}' with status {self.status} and priority {self.priority}"
+
+
+class Task(TaskColumns, Base):
+    """Горячие задачи. В PostgreSQL таблица секционирована по created_at,
+    поэтому created_at входит в первичный ключ."""
+
+    __tablename__ = 'tasks'
+
+    __table_args__ = (
+        PrimaryKeyConstraint('id', 'created_at'),
+        Index('idx_task_priority', 'priority'),
+        Index('idx_task_created_at_id', 'created_at', 'id'),
+        Index('idx_task_status_created_at_id', 'status', 'created_at', 'id'),
+        Index(
+            'idx_task_status_priority_created_at',
+            'status',
+            text('priority DESC'),
+            'created_at',
+        ),
+        # Частичные индексы покрывают только активные задачи и не растут
+        # вместе с архивом завершённых.
+        Index(
+            'idx_task_active_created_at_id',
+            'created_at',
+            'id',
+            postgresql_where=ACTIVE_STATUSES_CLAUSE,
+            sqlite_where=ACTIVE_STATUSES_CLAUSE,
+        ),
+        Index(
+            'idx_task_active_priority_created_at',
+            text('priority DESC'),
+            'created_at',
+            postgresql_where=ACTIVE_STATUSES_CLAUSE,
+            sqlite_where=ACTIVE_STATUSES_CLAUSE,
+        ),
+        Index(
+            'idx_task_lease_expires_at',
+            'lease_expires_at',
+            postgresql_where=IN_PROGRESS_CLAUSE,
+            sqlite_where=IN_PROGRESS_CLAUSE,
+        ),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+class ArchivedTask(TaskColumns, Base):
+    """Завершённые задачи из отсоединённых секций (холодное хранение)."""
+
+    __tablename__ = 'tasks_archive'
+
+    __table_args__ = (
+        PrimaryKeyConstraint('id'),
+        Index('idx_task_archive_created_at_id', 'created_at', 'id'),
+        Index(
+            'idx_task_archive_status_created_at_id',
+            'status',
+            'created_at',
+            'id',
+        ),
+    )
+
+
+# Секционированной таблице нужна хотя бы одна секция, иначе вставка
+# невозможна; для create_all достаточно секции по умолчанию. Секции по
+# месяцам создаёт app.services.partitions.
+event.listen(
+    Task.__table__,
+    'after_create',
+    DDL('CREATE TABLE tasks_default PARTITION OF tasks DEFAULT').execute_if(
+        dialect='postgresql'
+    ),
+)
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import timed
+from app.models.idempotency import TaskIdempotencyKey
+
+
+def fingerprint(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+class IdempotencyRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def claim(self, key: str, task_id, request_fingerprint: str):
+        """INSERT ключа, RETURNING task_id — только если ключ занят впервые.
+
+        Живой ключ не трогается (как ON CONFLICT DO NOTHING), истёкший,
+        но ещё не удалённый, переписывается на новую задачу.
+        """
+        now = datetime.now(timezone.utc)
+        if self.session.get_bind().dialect.name == 'postgresql':
+            stmt = postgresql.insert(TaskIdempotencyKey)
+        else:
+            stmt = sqlite.insert(TaskIdempotencyKey)
+        stmt = stmt.values(
+            key=key,
+            task_id=task_id,
+            fingerprint=request_fingerprint,
+            expires_at=now
+            + timedelta(seconds=settings.idempotency_key_ttl_seconds),
+        )
+
+        return stmt.on_conflict_do_update(
+            index_elements=[TaskIdempotencyKey.key],
+            set_={
+                'task_id': stmt.excluded.task_id,
+                'fingerprint': stmt.excluded.fingerprint,
+                'expires_at': stmt.excluded.expires_at,
+            },
+            where=TaskIdempotencyKey.expires_at <= now,
+        ).returning(TaskIdempotencyKey.task_id)
+
+    @timed('idempotency')
+    async def get(self, key: str) -> TaskIdempotencyKey | None:
+        return await self.session.scalar(
+            select(TaskIdempotencyKey).where(TaskIdempotencyKey.key == key)
+        )
+
+    @timed('idempotency')
+    async def purge_expired(self) -> int:
+        result = await self.session.execute(
+            delete(TaskIdempotencyKey).where(
+                TaskIdempotencyKey.expires_at <= datetime.now(timezone.utc)
+            )
+        )
+
+        return result.rowcount
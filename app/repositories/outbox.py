@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import timed
+from app.models.outbox import OutboxMessage
+from app.models.task import Task
+
+
+class OutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @timed('outbox')
+    async def add(self, tasks: Sequence[Task], delay: float = 0) -> None:
+        """Ставит задачи в outbox в текущей транзакции.
+
+        С delay > 0 релей опубликует их не раньше чем через delay секунд.
+        """
+        if not tasks:
+            return
+
+        available_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        await self.session.execute(
+            insert(OutboxMessage),
+            [
+                {
+                    'task_id': task.id,
+                    'priority': task.priority.numeric,
+                    'available_at': available_at,
+                }
+                for task in tasks
+            ],
+        )
+
+    @timed('outbox')
+    async def fetch_unsent(self, limit: int) -> Sequence[OutboxMessage]:
+        """Блокирует пачку готовых к отправке сообщений (SKIP LOCKED)."""
+        result = await self.session.execute(
+            select(OutboxMessage)
+            .where(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.available_at <= datetime.now(timezone.utc),
+            )
+            .order_by(OutboxMessage.available_at, OutboxMessage.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+
+        return result.scalars().all()
+
+    @timed('outbox')
+    async def mark_sent(self, message_ids: Sequence[int]) -> None:
+        if not message_ids:
+            return
+
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(message_ids))
+            .values(sent_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+
+    @timed('outbox')
+    async def purge_sent(self, older_than: datetime) -> int:
+        result = await self.session.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.sent_at.is_not(None),
+                OutboxMessage.sent_at < older_than,
+            )
+        )
+
+        return result.rowcount
@@ -0,0 +1,175 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Mapping, Sequence
+from uuid import UUID
+
+from sqlalchemy import Row, delete, event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import timed
+from app.models.stats import TaskCounter, TaskStatsMinute
+from app.models.task import Task, TaskStatus
+
+CREATED = 'CREATED'
+WAIT_SECONDS = 'wait_seconds'
+WAIT_COUNT = 'wait_count'
+RUN_SECONDS = 'run_seconds'
+RUN_COUNT = 'run_count'
+
+Key = tuple[str, object]
+
+# дельты счётчиков текущей транзакции в session.info
+PENDING = 'stats_pending'
+
+
+def minute_bucket(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def upsert_statement(session: Session, model, rows: list[dict]):
+    """value += delta для каждой строки одним INSERT ... ON CONFLICT."""
+    if session.get_bind().dialect.name == 'postgresql':
+        stmt = postgresql.insert(model).values(rows)
+    else:
+        stmt = sqlite.insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in model.__table__.primary_key],
+        set_={'value': model.value + stmt.excluded.value},
+    )
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_pending_counters(session: Session):
+    pending = session.info.pop(PENDING, None)
+    if not pending:
+        return
+
+    # Один shard на транзакцию, все её дельты — одним upsert на таблицу
+    # в порядке ключа: транзакции блокируют строки счётчиков в одном
+    # порядке, взаимных блокировок нет.
+    counters, events = pending
+    shard = random.randrange(settings.stats_counter_shards)
+    bucket = minute_bucket(datetime.now(timezone.utc))
+    counter_rows = [
+        {'name': name, 'priority': priority, 'shard': shard, 'value': value}
+        for (name, priority), value in sorted(counters.items())
+        if value
+    ]
+    event_rows = [
+        {'bucket': bucket, 'name': name, 'priority': priority,
+         'shard': shard, 'value': value}
+        for (name, priority), value in sorted(events.items())
+        if value
+    ]
+    if counter_rows:
+        session.execute(upsert_statement(session, TaskCounter, counter_rows))
+    if event_rows:
+        session.execute(
+            upsert_statement(session, TaskStatsMinute, event_rows)
+        )
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_counters(session: Session):
+    session.info.pop(PENDING, None)
+
+
+class StatsRepository:
+    """Счётчики задач, обновляемые в транзакции создания и перехода.
+
+    Чтение — сумма по фиксированному числу строк (статусы x приоритеты
+    x shard), не зависящему от размера tasks.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def increment(self, counters: Counter[Key], events: Counter[Key]):
+        """Копит дельты; в базу они пишутся при коммите транзакции."""
+        pending_counters, pending_events = self.session.info.setdefault(
+            PENDING, (Counter(), Counter())
+        )
+        pending_counters.update(counters)
+        pending_events.update(events)
+
+    async def record_created(self, tasks: Iterable[Task]):
+        counters: Counter[Key] = Counter()
+        events: Counter[Key] = Counter()
+        for task in tasks:
+            counters[task.status.value, task.priority] += 1
+            events[CREATED, task.priority] += 1
+        await self.increment(counters, events)
+
+    async def record_transitions(
+        self,
+        tasks: Iterable[Task],
+        old_statuses: Mapping[UUID, TaskStatus],
+        new_status: TaskStatus,
+    ):
+        counters: Counter[Key] = Counter()
+        events: Counter[Key] = Counter()
+        for task in tasks:
+            priority = task.priority
+            counters[old_statuses[task.id].value, priority] -= 1
+            counters[new_status.value, priority] += 1
+            events[new_status.value, priority] += 1
+            if new_status == TaskStatus.IN_PROGRESS and task.started_at:
+                counters[WAIT_SECONDS, priority] += (
+                    task.started_at - task.created_at
+                ).total_seconds()
+                counters[WAIT_COUNT, priority] += 1
+            elif new_status == TaskStatus.COMPLETED and task.completed_at:
+                counters[RUN_SECONDS, priority] += (
+                    task.completed_at - task.started_at
+                ).total_seconds()
+                counters[RUN_COUNT, priority] += 1
+        await self.increment(counters, events)
+
+    @timed('stats')
+    async def snapshot(self) -> Sequence[Row]:
+        """(name, priority, value) по всем счётчикам."""
+        result = await self.session.execute(
+            select(
+                TaskCounter.name,
+                TaskCounter.priority,
+                func.sum(TaskCounter.value).label('value'),
+            ).group_by(TaskCounter.name, TaskCounter.priority)
+        )
+
+        return result.all()
+
+    @timed('stats')
+    async def series(
+        self, since: datetime, until: datetime
+    ) -> Sequence[Row]:
+        """(bucket, name, value) по минутам в [since, until)."""
+        result = await self.session.execute(
+            select(
+                TaskStatsMinute.bucket,
+                TaskStatsMinute.name,
+                func.sum(TaskStatsMinute.value).label('value'),
+            )
+            .where(
+                TaskStatsMinute.bucket >= minute_bucket(since),
+                TaskStatsMinute.bucket < until,
+            )
+            .group_by(TaskStatsMinute.bucket, TaskStatsMinute.name)
+            .order_by(TaskStatsMinute.bucket)
+        )
+
+        return result.all()
+
+    @timed('stats')
+    async def purge_series(self, retention: timedelta) -> int:
+        result = await self.session.execute(
+            delete(TaskStatsMinute).where(
+                TaskStatsMinute.bucket
+                < datetime.now(timezone.utc) - retention
+            )
+        )
+
+        return result.rowcount
@@ -1,80 +1,623 @@
-from typing import Optional, Sequence
-from uuid import UUID
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Collection, Optional, Sequence
+from uuid import UUID, uuid4
 
-from sqlalchemy import select
+from sqlalchemy import (
+    DateTime,
+    Row,
+    any_,
+    bindparam,
+    cast,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    tuple_,
+    type_coerce,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.task import Task, TaskStatus
+from app.core.config import settings
+from app.core.metrics import timed
+from app.models.task import (
+    IN_PROGRESS_CLAUSE,
+    TERMINAL_STATUSES,
+    ArchivedTask,
+    Task,
+    TaskColumns,
+    TaskStatus,
+)
+from app.repositories.idempotency import IdempotencyRepository
+from app.repositories.stats import StatsRepository
 from app.schemas.task import TaskCreate
+from app.services.notifications import record_status_change
+
+Cursor = tuple[datetime, UUID]
+
+SUMMARY_FIELDS = (
+    'id',
+    'name',
+    'type',
+    'priority',
+    'status',
+    'created_at',
+    'status_changed_at',
+    'started_at',
+    'completed_at',
+    'attempts',
+    'max_attempts',
+    'worker_id',
+    'lease_expires_at',
+)
+LARGE_FIELDS = ('description', 'payload', 'result', 'error')
+
+VALID_TRANSITIONS: dict[TaskStatus, frozenset[TaskStatus]] = {
+    TaskStatus.NEW: frozenset({TaskStatus.PENDING, TaskStatus.CANCELLED}),
+    TaskStatus.PENDING: frozenset(
+        {TaskStatus.IN_PROGRESS, TaskStatus.CANCELLED, TaskStatus.FAILED}
+    ),
+    TaskStatus.IN_PROGRESS: frozenset(
+        # PENDING — повтор после ошибки; CANCELLED прерывает воркер
+        {
+            TaskStatus.COMPLETED,
+            TaskStatus.FAILED,
+            TaskStatus.PENDING,
+            TaskStatus.CANCELLED,
+        }
+    ),
+    # повторный запуск из dead-letter
+    TaskStatus.FAILED: frozenset({TaskStatus.PENDING}),
+}
+
+# Обратная таблица: из каких статусов можно попасть в данный.
+ALLOWED_SOURCES: dict[TaskStatus, tuple[TaskStatus, ...]] = {
+    target: tuple(
+        source
+        for source, targets in VALID_TRANSITIONS.items()
+        if target in targets
+    )
+    for target in TaskStatus
+}
+
+
+def encode_cursor(task: Task | Row) -> str:
+    raw = json.dumps([task.created_at.isoformat(), str(task.id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), UUID(task_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def page_query(
+    model: type[TaskColumns],
+    limit: int,
+    status: TaskStatus | None,
+    cursor: Optional[Cursor],
+    fields: Collection[str],
+):
+    columns = (getattr(model, f) for f in (*SUMMARY_FIELDS, *fields))
+    stmt = (
+        select(*columns)
+        .order_by(model.created_at.desc(), model.id.desc())
+        .limit(limit)
+    )
+    if status:
+        stmt = stmt.where(model.status == status)
+    if cursor:
+        # Избыточное условие по created_at даёт планировщику
+        # (в т.ч. SQLite) диапазонный поиск по индексу.
+        stmt = stmt.where(
+            tuple_(model.created_at, model.id) < tuple_(*cursor),
+            model.created_at <= cursor[0],
+        )
+
+    return stmt
 
 
 class TaskRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.stats = StatsRepository(session)
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.session.get_bind().dialect.name == 'postgresql'
+
+    def clock(self):
+        """Время базы в момент выполнения выражения.
+
+        Одни часы для всех хостов; clock_timestamp(), а не now(), чтобы
+        метка была как можно ближе к коммиту, а не к началу транзакции.
+        """
+        if self.is_postgres:
+            return func.clock_timestamp()
+        return type_coerce(
+            func.strftime('%Y-%m-%d %H:%M:%f', 'now'),
+            DateTime(timezone=True),
+        )
+
+    async def db_now(self) -> datetime:
+        now = await self.session.scalar(select(self.clock()))
+        if now.tzinfo is None:
+            # SQLite возвращает UTC без часового пояса
+            now = now.replace(tzinfo=timezone.utc)
+        return now
 
-    def model_from_schema(self, task_create: TaskCreate) -> Task:
+    def ids_condition(
+        self, model: type[TaskColumns], task_ids: Collection[UUID]
+    ):
+        """id из набора: id = ANY(:ids) в PostgreSQL, IN в остальных."""
+        if self.is_postgres:
+            ids = bindparam(
+                'ids', list(task_ids), type_=ARRAY(PG_UUID(as_uuid=True))
+            )
+            return model.id == any_(ids)
+        return model.id.in_(task_ids)
+
+    def models_for(
+        self, status: TaskStatus | None
+    ) -> tuple[type[TaskColumns], ...]:
+        """Таблицы, где могут быть задачи со статусом status."""
+        if status is None or status in TERMINAL_STATUSES:
+            return (Task, ArchivedTask)
+        return (Task,)
+
+    def model_from_schema(
+        self, task_create: TaskCreate, status: TaskStatus = TaskStatus.PENDING
+    ) -> Task:
         return Task(
+            id=uuid4(),
+            status=status,
             name=task_create.name,
             description=task_create.description,
+            type=task_create.type,
+            payload=task_create.payload,
             priority=task_create.priority,
+            max_attempts=task_create.max_attempts
+            or settings.task_max_attempts,
         )
 
+    @timed('task')
     async def create(self, task: Task) -> Task:
         self.session.add(task)
 
         try:
-            await self.session.commit()
-            await self.session.refresh(task)
+            await self.session.flush()
 
         except Exception as e:
             raise ValueError(f'Error when creating a task: {str(e)}')
 
+        await self.stats.record_created([task])
+
         return task
 
-    async def get(self, task_id: UUID) -> Task | None:
+    @timed('task')
+    async def create_idempotent(
+        self, task: Task, key: str, request_fingerprint: str
+    ) -> Task | None:
+        """Создаёт задачу, если Idempotency-Key ещё не занят.
+
+        None — ключ уже принадлежит другой задаче (повтор запроса).
+        """
+        claim = IdempotencyRepository(self.session).claim(
+            key, task.id, request_fingerprint
+        )
+        if self.is_postgres:
+            # Ключ и задача одним запросом: задача вставляется из RETURNING
+            # вставки ключа, без ключа SELECT пуст и задачи нет.
+            values = {
+                'id': task.id,
+                'name': task.name,
+                'description': task.description,
+                'type': task.type,
+                'payload': task.payload,
+                'priority': task.priority,
+                'status': task.status,
+                'max_attempts': task.max_attempts,
+            }
+            types = {name: Task.__table__.c[name].type for name in values}
+            # метки времени — по часам базы, как у переходов статуса
+            row = select(
+                *(
+                    cast(literal(value, types[name]), types[name])
+                    for name, value in values.items()
+                ),
+                func.now(),
+                func.now(),
+            ).select_from(claim.cte('claimed'))
+            result = await self.session.scalars(
+                insert(Task)
+                .from_select(
+                    [*values, 'created_at', 'status_changed_at'], row
+                )
+                .returning(Task)
+            )
+            created = result.one_or_none()
+        elif await self.session.scalar(claim) is None:
+            created = None
+        else:
+            self.session.add(task)
+            await self.session.flush()
+            created = task
+
+        if created is not None:
+            await self.stats.record_created([created])
+
+        return created
+
+    @timed('task')
+    async def create_many(
+        self,
+        tasks_in: Sequence[TaskCreate],
+        status: TaskStatus = TaskStatus.PENDING,
+    ) -> Sequence[Task]:
+        """Вставка пачки задач одним INSERT ... RETURNING."""
+        rows = [
+            {
+                'name': task_in.name,
+                'description': task_in.description,
+                'type': task_in.type,
+                'payload': task_in.payload,
+                'priority': task_in.priority,
+                'max_attempts': task_in.max_attempts
+                or settings.task_max_attempts,
+                'status': status,
+            }
+            for task_in in tasks_in
+        ]
+        result = await self.session.scalars(
+            insert(Task).returning(Task, sort_by_parameter_order=True), rows
+        )
+        tasks = result.all()
+        await self.stats.record_created(tasks)
+
+        return tasks
+
+    @timed('task')
+    async def get(self, task_id: UUID) -> Task | ArchivedTask | None:
+        """Задача из горячей таблицы, при промахе — из архива."""
         result = await self.session.execute(
             select(Task).where(Task.id == task_id)
         )
+        task = result.scalars().first()
+        if task is None:
+            result = await self.session.execute(
+                select(ArchivedTask).where(ArchivedTask.id == task_id)
+            )
+            task = result.scalars().first()
 
-        return result.scalars().first()
+        return task
+
+    @timed('task')
+    async def get_status(self, task_id: UUID) -> Row | None:
+        """Только id и статус задачи, без загрузки остальных колонок."""
+        for model in (Task, ArchivedTask):
+            result = await self.session.execute(
+                select(model.id, model.status).where(model.id == task_id)
+            )
+            row = result.first()
+            if row:
+                return row
 
+        return None
+
+    @timed('task')
+    async def get_statuses(self, task_ids: Collection[UUID]) -> list[Row]:
+        """id, статус и время его смены для набора задач.
+
+        Один запрос по горячей таблице (id = ANY(:ids) в PostgreSQL),
+        архив читается только для не найденных id.
+        """
+        rows = []
+        missing = set(task_ids)
+        for model in (Task, ArchivedTask):
+            if not missing:
+                break
+            result = await self.session.execute(
+                select(
+                    model.id, model.status, model.status_changed_at
+                ).where(self.ids_condition(model, missing))
+            )
+            found = result.all()
+            rows.extend(found)
+            missing.difference_update(row.id for row in found)
+
+        return rows
+
+    @timed('task')
     async def list(
         self,
-        skip: int = 0,
         limit: int = 100,
         status: TaskStatus | None = None,
-    ) -> Sequence[Task]:
-        stmt = select(Task).offset(skip).limit(limit)
-        if status:
-            stmt = stmt.where(Task.status == status)
-        result = await self.session.execute(stmt)
+        cursor: Optional[Cursor] = None,
+        fields: Collection[str] = (),
+    ) -> Sequence[Row]:
+        """Страница задач от новых к старым (keyset по created_at, id).
+
+        Большие текстовые колонки выбираются только если указаны в fields.
+        Архив (только завершённые задачи) читается той же keyset-выборкой,
+        страницы двух таблиц сливаются по ключу сортировки.
+        """
+        rows = (
+            await self.session.execute(
+                page_query(Task, limit, status, cursor, fields)
+            )
+        ).all()
+        if ArchivedTask in self.models_for(status):
+            archived = (
+                await self.session.execute(
+                    page_query(ArchivedTask, limit, status, cursor, fields)
+                )
+            ).all()
+            if archived:
+                # во время архивации строка может быть в обеих таблицах
+                hot_ids = {row.id for row in rows}
+                rows = sorted(
+                    [*rows, *(r for r in archived if r.id not in hot_ids)],
+                    key=lambda row: (row.created_at, row.id),
+                    reverse=True,
+                )[:limit]
 
-        return result.scalars().all()
+        return rows
 
+    async def stream(
+        self,
+        status: TaskStatus | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        fields: Collection[str] = (),
+        chunk_size: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """Все подходящие задачи пачками через серверный курсор.
+
+        В памяти одновременно не больше chunk_size строк. Сначала горячая
+        таблица, затем архив, внутри каждой — по created_at, id.
+        """
+        for model in self.models_for(status):
+            stmt = select(
+                *(getattr(model, f) for f in (*SUMMARY_FIELDS, *fields))
+            ).order_by(model.created_at, model.id)
+            if status:
+                stmt = stmt.where(model.status == status)
+            if created_from:
+                stmt = stmt.where(model.created_at >= created_from)
+            if created_to:
+                stmt = stmt.where(model.created_at < created_to)
+
+            result = await self.session.stream(
+                stmt.execution_options(yield_per=chunk_size)
+            )
+            async for rows in result.partitions():
+                yield rows
+
+    @timed('task')
+    async def estimate_count(self, status: TaskStatus | None = None) -> int:
+        """Оценка количества задач без COUNT(*) по всей таблице."""
+        if not self.is_postgres:
+            total = 0
+            for model in (Task, ArchivedTask):
+                stmt = select(func.count()).select_from(model)
+                if status:
+                    stmt = stmt.where(model.status == status)
+                total += (await self.session.execute(stmt)).scalar_one()
+            return total
+
+        if status is None:
+            # reltuples самой секционированной таблицы не ведётся,
+            # суммируем по секциям и архиву.
+            result = await self.session.execute(
+                text(
+                    "SELECT coalesce(sum(greatest(reltuples, 0)), 0)::bigint "
+                    "FROM pg_class WHERE oid = 'tasks_archive'::regclass "
+                    "OR oid IN (SELECT inhrelid FROM pg_inherits "
+                    "WHERE inhparent = 'tasks'::regclass)"
+                )
+            )
+            return result.scalar_one()
+
+        stmt = union_all(
+            select(Task.id).where(Task.status == status),
+            select(ArchivedTask.id).where(ArchivedTask.status == status),
+        )
+        compiled = stmt.compile(
+            dialect=self.session.get_bind().dialect,
+            compile_kwargs={'literal_binds': True},
+        )
+        result = await self.session.execute(
+            text(f'EXPLAIN (FORMAT JSON) {compiled}')
+        )
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @timed('task')
     async def update_status(
-        self, task: Task, new_status: TaskStatus, **kwargs
-    ):
-        valid_transitions = {
-            TaskStatus.NEW: [TaskStatus.PENDING, TaskStatus.CANCELLED],
-            TaskStatus.PENDING: [
-                TaskStatus.IN_PROGRESS,
-                TaskStatus.CANCELLED,
-                TaskStatus.FAILED,
-            ],
-            TaskStatus.IN_PROGRESS: [TaskStatus.COMPLETED, TaskStatus.FAILED],
-        }
+        self,
+        task_id: UUID,
+        new_status: TaskStatus,
+        *,
+        from_statuses: Collection[TaskStatus] | None = None,
+        owned_by: str | None = None,
+        **kwargs,
+    ) -> Task | None:
+        """Атомарный переход статуса одним UPDATE ... RETURNING.
 
-        if new_status not in valid_transitions.get(task.status, []):
-            raise ValueError(
-                f'Invalid status transition from {task.status} to {new_status}'
+        Возвращает обновлённую задачу или None, если задачи нет или её
+        текущий статус не допускает перехода в new_status. from_statuses
+        сужает допустимые исходные статусы, owned_by — только задачи,
+        взятые этим воркером.
+        """
+        condition = Task.id == task_id
+        if owned_by is not None:
+            condition = condition & (Task.worker_id == owned_by)
+        tasks = await self._transition(
+            condition, new_status, from_statuses, kwargs
+        )
+
+        return tasks[0] if tasks else None
+
+    @timed('task')
+    async def update_status_many(
+        self,
+        task_ids: Collection[UUID],
+        new_status: TaskStatus,
+        *,
+        from_statuses: Collection[TaskStatus] | None = None,
+        owned_by: str | None = None,
+        **kwargs,
+    ) -> Sequence[Task]:
+        """Тот же переход для пачки задач одним UPDATE ... RETURNING.
+
+        Возвращает только задачи, для которых переход состоялся.
+        """
+        if not task_ids:
+            return []
+
+        condition = self.ids_condition(Task, task_ids)
+        if owned_by is not None:
+            condition = condition & (Task.worker_id == owned_by)
+        return await self._transition(
+            condition, new_status, from_statuses, kwargs
+        )
+
+    @timed('task')
+    async def renew_leases(
+        self, worker_id: str, task_ids: Collection[UUID], until: datetime
+    ) -> int:
+        """Продлевает аренду задач воркера одним UPDATE."""
+        if not task_ids:
+            return 0
+
+        result = await self.session.execute(
+            update(Task)
+            .where(
+                self.ids_condition(Task, task_ids),
+                Task.worker_id == worker_id,
+                Task.status == TaskStatus.IN_PROGRESS,
             )
+            .values(lease_expires_at=until)
+            .execution_options(synchronize_session=False)
+        )
 
-        for key, value in kwargs.items():
-            setattr(task, key, value)
+        return result.rowcount
 
-        task.status = new_status
+    @timed('task')
+    async def lock_expired_leases(
+        self, now: datetime, limit: int
+    ) -> Sequence[Row]:
+        """Блокирует пачку задач с истёкшей арендой (SKIP LOCKED).
 
-        await self.session.flush()
-        await self.session.refresh(task)
+        Условие на статус совпадает с предикатом частичного индекса
+        idx_task_lease_expires_at буквально, поэтому индекс подходит и
+        для подготовленных запросов.
+        """
+        result = await self.session.execute(
+            select(Task.id, Task.attempts, Task.max_attempts)
+            .where(IN_PROGRESS_CLAUSE, Task.lease_expires_at < now)
+            .order_by(Task.lease_expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
 
-        return task
+        return result.all()
+
+    async def _transition(
+        self,
+        condition,
+        new_status: TaskStatus,
+        from_statuses: Collection[TaskStatus] | None,
+        values: dict,
+    ) -> Sequence[Task]:
+        sources = ALLOWED_SOURCES.get(new_status, ())
+        if from_statuses is not None:
+            sources = tuple(s for s in sources if s in from_statuses)
+        if not sources:
+            raise ValueError(f'No status transitions lead to {new_status}')
+
+        values = {
+            'status': new_status,
+            'status_changed_at': self.clock(),
+            **values,
+        }
+        options = {'synchronize_session': False, 'populate_existing': True}
+        # Счётчикам нужен исходный статус. При одном возможном источнике
+        # он известен и переход — один UPDATE ... RETURNING.
+        if len(sources) == 1:
+            result = await self.session.execute(
+                update(Task)
+                .where(condition, Task.status.in_(sources))
+                .values(**values)
+                .returning(Task)
+                .execution_options(**options)
+            )
+            tasks = result.scalars().all()
+            old_statuses = defaultdict(lambda: sources[0])
+        elif self.is_postgres:
+            # Исходный статус возвращает тот же UPDATE из подзапроса.
+            # FOR UPDATE в нём берёт те же блокировки строк, что и сам
+            # UPDATE, но при гонке отдаёт версию строки после ожидания,
+            # поэтому статус точен.
+            old = (
+                select(Task.id, Task.created_at, Task.status)
+                .where(condition, Task.status.in_(sources))
+                .with_for_update()
+                .subquery('old')
+            )
+            result = await self.session.execute(
+                update(Task)
+                .where(
+                    Task.id == old.c.id,
+                    Task.created_at == old.c.created_at,
+                    Task.status.in_(sources),
+                )
+                .values(**values)
+                .returning(Task, old.c.status)
+                .execution_options(**options)
+            )
+            rows = result.all()
+            tasks = [task for task, _ in rows]
+            old_statuses = {task.id: status for task, status in rows}
+        else:
+            # SQLite отдаёт из подзапроса UPDATE ... FROM уже новый статус;
+            # на нём (только тесты) статусы читаются отдельным запросом.
+            result = await self.session.execute(
+                select(Task.id, Task.status).where(
+                    condition, Task.status.in_(sources)
+                )
+            )
+            old_statuses = dict(result.tuples().all())
+            if not old_statuses:
+                return []
+            result = await self.session.execute(
+                update(Task)
+                .where(
+                    self.ids_condition(Task, old_statuses),
+                    Task.status.in_(sources),
+                )
+                .values(**values)
+                .returning(Task)
+                .execution_options(**options)
+            )
+            tasks = result.scalars().all()
+        await self.stats.record_transitions(tasks, old_statuses, new_status)
+        for task in tasks:
+            record_status_change(
+                self.session.sync_session, task.id, new_status
+            )
+
+        return tasks
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.services.task_cache import task_cache
+
+router = APIRouter(tags=['system'])
+
+
+@router.get('/api/v1/system/cache')
+async def cache_stats() -> dict[str, int]:
+    return task_cache.stats()
+
+
+@router.get('/metrics', include_in_schema=False)
+def metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
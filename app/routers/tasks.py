@@ -1,72 +1,403 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_pagination import Page, paginate
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.db.session import get_db_session
-from app.models.task import Task, TaskStatus
-from app.repositories.task import TaskRepository
-from app.schemas.task import TaskCreate, TaskOut, TaskStatusOut
-from app.services.task_service import publish_task
+from app.models.task import TERMINAL_STATUSES, TaskStatus
+from app.repositories.idempotency import IdempotencyRepository, fingerprint
+from app.repositories.outbox import OutboxRepository
+from app.repositories.stats import StatsRepository, minute_bucket
+from app.repositories.task import (
+    LARGE_FIELDS,
+    SUMMARY_FIELDS,
+    TaskRepository,
+    decode_cursor,
+    encode_cursor,
+)
+from app.schemas.task import (
+    TaskBatchItemOut,
+    TaskBatchOut,
+    TaskCreate,
+    TaskOut,
+    TaskPage,
+    TaskStatusBatchIn,
+    TaskStatusBatchOut,
+    TaskStatusChangeOut,
+    TaskStatsOut,
+    TaskStatusOut,
+)
+from app.services.handlers import handlers
+from app.services.task_cache import task_cache
+from app.services.task_events import (
+    next_status,
+    parse_wait,
+    task_events,
+)
+from app.services.task_export import EXPORT_MEDIA_TYPES, SERIALIZERS
+from app.services.task_stats import build_series, build_stats
 
 router = APIRouter(prefix='/api/v1/tasks', tags=['tasks'])
 
 
-async def handle_task_creation_error(
-    task: Task, repo: TaskRepository, error: Exception, session: AsyncSession
-):
-    try:
-        task = await repo.update_status(
-            task, TaskStatus.FAILED, error=str(error)
-        )
-        await session.commit()
-    except ValueError:
-        task.error = str(error)
-        await session.commit()
+def unknown_type_error(task_in: TaskCreate) -> str | None:
+    if task_in.type not in handlers:
+        return f'type: Unknown task type: {task_in.type}'
+    return None
 
 
 @router.post('', response_model=TaskOut, status_code=status.HTTP_201_CREATED)
 async def create_task(
-    task_in: TaskCreate, session: AsyncSession = Depends(get_db_session)
+    task_in: TaskCreate,
+    response: Response,
+    idempotency_key: str | None = Header(None, min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_db_session),
 ):
+    """Создаёт задачу.
+
+    С заголовком Idempotency-Key повтор запроса в течение
+    IDEMPOTENCY_KEY_TTL_SECONDS возвращает уже созданную задачу (200)
+    и не публикует её второй раз.
+    """
+    error = unknown_type_error(task_in)
+    if error:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error)
+
     repo = TaskRepository(session)
     task = repo.model_from_schema(task_in)
-    task = await repo.create(task)
+    if idempotency_key is None:
+        task = await repo.create(task)
+    else:
+        request_fingerprint = fingerprint(task_in)
+        task = await repo.create_idempotent(
+            task, idempotency_key, request_fingerprint
+        )
+        if task is None:
+            return await replay_task(
+                repo, idempotency_key, request_fingerprint, response
+            )
+    await OutboxRepository(session).add([task])
+    await session.commit()
 
-    try:
-        await repo.update_status(task, TaskStatus.PENDING)
-        await publish_task(str(task.id), task.priority.numeric, session)
+    return TaskOut.model_validate(task)
 
-        return TaskOut.model_validate(task)
 
-    except Exception as e:
-        await handle_task_creation_error(task, repo, e, session)
+async def replay_task(
+    repo: TaskRepository,
+    idempotency_key: str,
+    request_fingerprint: str,
+    response: Response,
+) -> TaskOut:
+    stored = await IdempotencyRepository(repo.session).get(idempotency_key)
+    if stored is None:
+        # ключ истёк и удалён между вставкой и чтением
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Idempotency key expired, retry the request',
+        )
+    if stored.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Idempotency key was used with a different request body',
+        )
+    task = await repo.get(stored.task_id)
+    if task is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail='Task not found'
+        )
+
+    response.status_code = status.HTTP_200_OK
+    response.headers['Idempotent-Replayed'] = 'true'
+    return TaskOut.model_validate(task)
+
+
+@router.post(
+    ':batch', response_model=TaskBatchOut, status_code=status.HTTP_201_CREATED
+)
+async def create_tasks_batch(
+    payload: list[dict[str, Any]],
+    session: AsyncSession = Depends(get_db_session),
+):
+    if not payload or len(payload) > settings.batch_max_size:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f'Failed to publish task: {str(e)}',
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f'Batch must contain 1..{settings.batch_max_size} tasks',
         )
 
+    items: list[TaskBatchItemOut] = []
+    valid: list[tuple[int, TaskCreate]] = []
+    for index, raw in enumerate(payload):
+        try:
+            task_in = TaskCreate.model_validate(raw)
+        except ValidationError as e:
+            error = '; '.join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                for err in e.errors()
+            )
+        else:
+            error = unknown_type_error(task_in)
+            if error is None:
+                valid.append((index, task_in))
+                continue
+        items.append(TaskBatchItemOut(index=index, success=False, error=error))
+
+    if valid:
+        repo = TaskRepository(session)
+        tasks = await repo.create_many([task_in for _, task_in in valid])
+        await OutboxRepository(session).add(tasks)
+        await session.commit()
+
+        items.extend(
+            TaskBatchItemOut(
+                index=index, success=True, task=TaskOut.model_validate(task)
+            )
+            for (index, _), task in zip(valid, tasks)
+        )
+
+    return TaskBatchOut(items=sorted(items, key=lambda item: item.index))
+
 
-@router.get('', response_model=Page[TaskOut])
+def parse_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return []
+
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = set(requested) - set(LARGE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    return list(dict.fromkeys(requested))
+
+
+@router.get('', response_model=TaskPage)
 async def list_tasks(
     session: AsyncSession = Depends(get_db_session),
     status: TaskStatus | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    include_total: bool = False,
+    fields: str | None = Query(
+        None, description='Large fields to include: description,result,error'
+    ),
 ):
     repo = TaskRepository(session)
-    tasks = await repo.list(status=status)
+    try:
+        position = decode_cursor(cursor) if cursor else None
+        extra_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
 
-    return paginate([TaskOut.model_validate(t) for t in tasks])
+    tasks = await repo.list(
+        limit=limit + 1, status=status, cursor=position, fields=extra_fields
+    )
+    next_cursor = None
+    if len(tasks) > limit:
+        next_cursor = encode_cursor(tasks[limit - 1])
+    total = await repo.estimate_count(status) if include_total else None
 
+    return TaskPage(
+        items=[TaskOut.model_validate(t) for t in tasks[:limit]],
+        next_cursor=next_cursor,
+        total=total,
+    )
 
-@router.get('/{task_id}', response_model=TaskOut)
-async def get_task(
+
+@router.get('/export')
+async def export_tasks(
+    session: AsyncSession = Depends(get_db_session),
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+    status: TaskStatus | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    fields: str | None = Query(
+        None, description='Large fields to include: description,result,error'
+    ),
+):
+    """Выгрузка всех подходящих задач потоком, без моделей на строку.
+
+    Сессия из зависимости закрывается после отправки ответа, поэтому
+    курсор живёт всё время стриминга.
+    """
+    try:
+        extra_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    chunks = TaskRepository(session).stream(
+        status=status,
+        created_from=created_from,
+        created_to=created_to,
+        fields=extra_fields,
+        chunk_size=settings.export_chunk_size,
+    )
+    columns = [*SUMMARY_FIELDS, *extra_fields]
+
+    return StreamingResponse(
+        SERIALIZERS[format](chunks, columns),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            'Content-Disposition': f'attachment; filename="tasks.{format}"'
+        },
+    )
+
+
+@router.get(':dead-letter', response_model=TaskPage)
+async def list_dead_letter(
+    session: AsyncSession = Depends(get_db_session),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Задачи, исчерпавшие попытки (FAILED), вместе с последней ошибкой."""
+    return await list_tasks(
+        session=session,
+        status=TaskStatus.FAILED,
+        cursor=cursor,
+        limit=limit,
+        include_total=False,
+        fields='error',
+    )
+
+
+@router.get('/stats', response_model=TaskStatsOut)
+async def get_task_stats(
+    session: AsyncSession = Depends(get_db_session),
+    since: datetime | None = Query(
+        None, description='Start of the throughput series; omitted — no series'
+    ),
+    until: datetime | None = None,
+    bucket: int = Query(1, ge=1, le=1440, description='Bucket, minutes'),
+):
+    """Счётчики по статусам и приоритетам, средние ожидание и выполнение.
+
+    Читаются из task_counters, а не из tasks, поэтому время ответа не
+    зависит от числа задач. С since добавляется ряд событий по интервалам.
+    """
+    repo = StatsRepository(session)
+    stats = build_stats(await repo.snapshot())
+    if since is None:
+        return stats
+
+    until = until or datetime.now(timezone.utc)
+    since, until = (
+        minute_bucket(t if t.tzinfo else t.replace(tzinfo=timezone.utc))
+        for t in (since, until)
+    )
+    step = timedelta(minutes=bucket)
+    if not since < until or (until - since) / step > (
+        settings.stats_series_max_points
+    ):
+        raise HTTPException(
+            400,
+            detail=f'Series must cover 1..{settings.stats_series_max_points} '
+            f'buckets',
+        )
+    stats.series = build_series(
+        await repo.series(since, until + timedelta(minutes=1)), since, step
+    )
+
+    return stats
+
+
+def changed_after(row, since: datetime) -> bool:
+    changed_at = row.status_changed_at
+    if changed_at.tzinfo is None:
+        # SQLite не хранит часовой пояс, время записывается в UTC
+        changed_at = changed_at.replace(tzinfo=timezone.utc)
+    return changed_at > since
+
+
+@router.post('/status:batch', response_model=TaskStatusBatchOut)
+async def get_task_statuses(
+    payload: TaskStatusBatchIn,
+    session: AsyncSession = Depends(get_db_session),
+):
+    """Статусы многих задач одним запросом.
+
+    С since возвращаются только задачи, статус которых менялся позже;
+    неизвестные id всегда перечисляются в unknown.
+    """
+    if not payload.ids or len(payload.ids) > settings.status_batch_max_size:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f'Batch must contain '
+            f'1..{settings.status_batch_max_size} ids',
+        )
+
+    repo = TaskRepository(session)
+    # Метка смены статуса ставится до коммита перехода: изменение с меткой
+    # чуть раньше чтения может стать видимым уже после него. as_of
+    # сдвигается назад на окно перекрытия, такие изменения придут в
+    # следующем опросе (возможно, повторно).
+    as_of = await repo.db_now() - timedelta(
+        seconds=settings.status_poll_overlap
+    )
+    rows = await repo.get_statuses(payload.ids)
+    found = {row.id for row in rows}
+    if payload.since:
+        since = payload.since
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        rows = [row for row in rows if changed_after(row, since)]
+
+    return TaskStatusBatchOut(
+        items=[TaskStatusChangeOut.model_validate(row) for row in rows],
+        unknown=[i for i in dict.fromkeys(payload.ids) if i not in found],
+        as_of=as_of,
+    )
+
+
+@router.post('/{task_id}:redrive', response_model=TaskOut)
+async def redrive_task(
     task_id: UUID, session: AsyncSession = Depends(get_db_session)
 ):
+    """Возвращает задачу из dead-letter в очередь со сброшенными попытками."""
     repo = TaskRepository(session)
-    task = await repo.get(task_id)
+    task = await repo.update_status(
+        task_id,
+        TaskStatus.PENDING,
+        from_statuses={TaskStatus.FAILED},
+        attempts=0,
+        error=None,
+        started_at=None,
+        completed_at=None,
+    )
     if task:
+        await OutboxRepository(session).add([task])
+        await session.commit()
         return TaskOut.model_validate(task)
+
+    if not await repo.get(task_id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, 'Task not found')
+    raise HTTPException(
+        status.HTTP_400_BAD_REQUEST, 'Only failed tasks can be redriven'
+    )
+
+
+@router.get('/{task_id}', response_model=TaskOut)
+async def get_task(
+    task_id: UUID, session: AsyncSession = Depends(get_db_session)
+):
+    async def load() -> TaskOut | None:
+        task = await TaskRepository(session).get(task_id)
+        return TaskOut.model_validate(task) if task else None
+
+    task = await task_cache.get_or_load('task', task_id, load)
+    if task:
+        return task
     raise HTTPException(status.HTTP_404_NOT_FOUND, detail='Task not found')
 
 
@@ -74,30 +405,117 @@ async def get_task(
 async def cancel_task(
     task_id: UUID, session: AsyncSession = Depends(get_db_session)
 ):
+    """Отменяет задачу; выполняющуюся прерывает воркер по уведомлению."""
     repo = TaskRepository(session)
-    task = await repo.get(task_id)
-    if not task:
+    task = await repo.update_status(task_id, TaskStatus.CANCELLED)
+    if task:
+        await session.commit()
+        return TaskOut.model_validate(task)
+
+    if not await repo.get(task_id):
         raise HTTPException(status.HTTP_404_NOT_FOUND, 'Task not found')
+    raise HTTPException(
+        status.HTTP_400_BAD_REQUEST, 'Cannot cancel task in current status'
+    )
 
-    if task.status not in (TaskStatus.NEW, TaskStatus.PENDING):
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST, 'Cannot cancel task in current status'
-        )
 
-    try:
-        task = await repo.update_status(task, TaskStatus.CANCELLED)
-        await session.commit()
-        return TaskOut.model_validate(task)
-    except ValueError as e:
-        raise HTTPException(status.HTTP_409_CONFLICT, detail=str(e))
+async def load_task_status(
+    session: AsyncSession, task_id: UUID
+) -> TaskStatusOut:
+    async def load() -> TaskStatusOut | None:
+        row = await TaskRepository(session).get_status(task_id)
+        return TaskStatusOut.model_validate(row) if row else None
+
+    task_status = await task_cache.get_or_load('status', task_id, load)
+    if task_status:
+        return task_status
+    raise HTTPException(status.HTTP_404_NOT_FOUND, detail='Task not found')
 
 
 @router.get('/{task_id}/status', response_model=TaskStatusOut)
 async def get_task_status(
+    task_id: UUID,
+    session: AsyncSession = Depends(get_db_session),
+    wait: str | None = Query(
+        None, description='Long-poll: wait for a status change, e.g. 30s'
+    ),
+):
+    timeout = 0.0
+    if wait:
+        try:
+            timeout = min(parse_wait(wait), settings.long_poll_max_wait)
+        except ValueError as e:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    with task_events.listen(task_id) as events:
+        task_status = await load_task_status(session, task_id)
+        # ожидание держит только подписку, соединение возвращается в пул
+        await session.close()
+        if timeout <= 0 or task_status.status in TERMINAL_STATUSES:
+            return task_status
+
+        try:
+            new_status = await asyncio.wait_for(
+                next_status(events, task_status.status), timeout
+            )
+        except asyncio.TimeoutError:
+            return task_status
+
+    if new_status is None:
+        # процесс останавливается
+        return task_status
+    return TaskStatusOut(id=task_id, status=new_status)
+
+
+def format_status_event(task_status: TaskStatusOut) -> str:
+    return f'event: status\ndata: {task_status.model_dump_json()}\n\n'
+
+
+@router.get('/{task_id}/events')
+async def stream_task_events(
     task_id: UUID, session: AsyncSession = Depends(get_db_session)
 ):
-    repo = TaskRepository(session)
-    task = await repo.get(task_id)
-    if task:
-        return TaskStatusOut.model_validate(task)
-    raise HTTPException(status.HTTP_404_NOT_FOUND, detail='Task not found')
+    events = task_events.subscribe(task_id)
+    try:
+        task_status = await load_task_status(session, task_id)
+    except HTTPException:
+        task_events.unsubscribe(task_id, events)
+        raise
+    finally:
+        # поток может идти минутами, соединение ему не нужно
+        await session.close()
+
+    async def stream():
+        # Поток ограничен SSE_MAX_DURATION: клиент переподключается, а
+        # открытое соединение не держит остановку процесса.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.sse_max_duration
+        try:
+            yield format_status_event(task_status)
+            current = task_status.status
+            while current not in TERMINAL_STATUSES:
+                remaining = max(deadline - loop.time(), 0)
+                try:
+                    current = await asyncio.wait_for(
+                        next_status(events, current),
+                        min(settings.sse_heartbeat_interval, remaining),
+                    )
+                except asyncio.TimeoutError:
+                    if loop.time() >= deadline:
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                if current is None:
+                    # процесс останавливается, клиент переподключится
+                    return
+                yield format_status_event(
+                    TaskStatusOut(id=task_id, status=current)
+                )
+        finally:
+            task_events.unsubscribe(task_id, events)
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
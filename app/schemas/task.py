@@ -1,34 +1,94 @@
 from datetime import datetime
+from typing import Any
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.models.task import TaskPriority, TaskStatus
+from app.models.task import DEFAULT_TASK_TYPE, TaskPriority, TaskStatus
 
 
 class TaskCreate(BaseModel):
     name: str
     description: str | None = None
     priority: TaskPriority = TaskPriority.MEDIUM
+    max_attempts: int | None = Field(None, ge=1, le=100)
+    type: str = Field(DEFAULT_TASK_TYPE, max_length=64)
+    payload: Any = None
 
 
 class TaskOut(BaseModel):
     id: UUID
     name: str
-    description: str | None
+    description: str | None = None
+    type: str = DEFAULT_TASK_TYPE
+    payload: Any = None
     priority: TaskPriority
     status: TaskStatus
     created_at: datetime
+    status_changed_at: datetime | None = None
     started_at: datetime | None = None
     completed_at: datetime | None = None
     result: str | None = None
     error: str | None = None
+    attempts: int
+    max_attempts: int
+    worker_id: str | None = None
+    lease_expires_at: datetime | None = None
 
     model_config = {'from_attributes': True}
 
 
+class TaskBatchItemOut(BaseModel):
+    index: int
+    success: bool
+    task: TaskOut | None = None
+    error: str | None = None
+
+
+class TaskBatchOut(BaseModel):
+    items: list[TaskBatchItemOut]
+
+
 class TaskStatusOut(BaseModel):
     status: TaskStatus
     id: UUID
 
     model_config = {'from_attributes': True}
+
+
+class TaskStatusChangeOut(TaskStatusOut):
+    status_changed_at: datetime
+
+
+class TaskStatusBatchIn(BaseModel):
+    ids: list[UUID]
+    since: datetime | None = None
+
+
+class TaskStatusBatchOut(BaseModel):
+    items: list[TaskStatusChangeOut]
+    unknown: list[UUID]
+    # время базы до чтения минус STATUS_POLL_OVERLAP: передаётся как since
+    # в следующем опросе
+    as_of: datetime
+
+
+class TaskPage(BaseModel):
+    items: list[TaskOut]
+    next_cursor: str | None = None
+    total: int | None = None
+
+
+class TaskStatsBucketOut(BaseModel):
+    bucket: datetime
+    # CREATED и статусы, в которые задачи перешли за интервал
+    counts: dict[str, int]
+
+
+class TaskStatsOut(BaseModel):
+    total: int
+    by_status: dict[TaskStatus, int]
+    by_priority: dict[TaskPriority, dict[TaskStatus, int]]
+    avg_wait_seconds: float | None = None
+    avg_run_seconds: float | None = None
+    series: list[TaskStatsBucketOut] | None = None
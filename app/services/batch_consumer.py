@@ -0,0 +1,293 @@
+"""Пакетный режим воркера.
+
+До batch_size сообщений, выданных планировщиком (свободных слотов),
+переводятся в IN_PROGRESS одним UPDATE ... RETURNING. Завершения копятся в write-behind буфере и
+записываются одним UPDATE по размеру или по таймеру. После коммита
+сообщения подтверждаются ack(multiple=True) по непрерывному префиксу
+delivery tag.
+"""
+import asyncio
+import json
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import DateTime, case, literal
+
+from app.brokers.base import Broker, BrokerMessage
+from app.core.logger import logger
+from app.core.metrics import TASK_EXECUTION, WORKER_TASKS_IN_FLIGHT
+from app.db.session import get_db_session
+from app.models.task import Task, TaskStatus
+from app.repositories.task import TaskRepository
+from app.services.cancellation import cancellations
+from app.services.leases import leases
+from app.services.scheduler import PriorityScheduler
+from app.services.task_service import (
+    execute_task,
+    observe_queue_wait,
+    retry_or_fail,
+)
+
+
+class AckTracker:
+    """Подтверждает сообщения одним ack(multiple=True) на префикс.
+
+    ack(multiple=True) по тегу N подтверждает все теги до N, поэтому
+    отправляется только когда все более ранние сообщения уже обработаны.
+    Теги и префиксы ведутся отдельно для каждой очереди (канала).
+    """
+
+    def __init__(self):
+        self._pending: dict[str, OrderedDict[int, BrokerMessage]] = (
+            defaultdict(OrderedDict)
+        )
+        self._settled: set[tuple[str, int]] = set()
+        self._rejected: set[tuple[str, int]] = set()
+        self._lock = asyncio.Lock()
+
+    def track(self, message: BrokerMessage):
+        self._pending[message.queue][message.delivery_tag] = message
+
+    @property
+    def pending(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    async def settle(self, messages: Iterable[BrokerMessage]):
+        # lock держит ack в порядке возрастания тегов
+        async with self._lock:
+            self._settled.update(
+                (m.queue, m.delivery_tag) for m in messages
+            )
+            for queue, pending in self._pending.items():
+                last = None
+                while pending:
+                    key = (queue, next(iter(pending)))
+                    if key not in self._settled:
+                        break
+                    message = pending.pop(key[1])
+                    self._settled.discard(key)
+                    # отклонённый тег брокеру уже неизвестен
+                    if key in self._rejected:
+                        self._rejected.discard(key)
+                    else:
+                        last = message
+                if last is not None:
+                    await last.ack(multiple=True)
+
+    async def reject(self, messages: Iterable[BrokerMessage], requeue: bool):
+        messages = list(messages)
+        for message in messages:
+            await message.nack(requeue=requeue)
+            self._rejected.add((message.queue, message.delivery_tag))
+        await self.settle(messages)
+
+
+class CompletionBuffer:
+    """Write-behind буфер завершённых задач."""
+
+    def __init__(self, acks: AckTracker, size: int, interval: float):
+        self.acks = acks
+        self.size = size
+        self.interval = interval
+        self._items: dict[UUID, tuple[datetime, str, BrokerMessage]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def add(self, task_id: UUID, result: str, message: BrokerMessage):
+        # Аренда продлевается, пока завершение не закоммичено: иначе при
+        # медленном сбросе reaper вернёт выполненную задачу в очередь.
+        leases.held.add(task_id)
+        self._items[task_id] = (datetime.now(timezone.utc), result, message)
+        if len(self._items) >= self.size:
+            await self.flush_logged()
+
+    async def flush(self):
+        if not self._items:
+            return
+        items, self._items = self._items, {}
+
+        completed_at = case(
+            {
+                task_id: literal(at, DateTime(timezone=True))
+                for task_id, (at, _, _) in items.items()
+            },
+            value=Task.id,
+        )
+        result = case(
+            {task_id: r for task_id, (_, r, _) in items.items()},
+            value=Task.id,
+        )
+        try:
+            async for session in get_db_session():
+                repo = TaskRepository(session)
+                completed = await repo.update_status_many(
+                    list(items),
+                    TaskStatus.COMPLETED,
+                    from_statuses={TaskStatus.IN_PROGRESS},
+                    owned_by=leases.worker_id,
+                    completed_at=completed_at,
+                    result=result,
+                )
+                await session.commit()
+        except Exception:
+            # сообщения не подтверждены, запишем на следующем сбросе
+            self._items = {**items, **self._items}
+            raise
+        leases.held.difference_update(items)
+
+        for task in completed:
+            TASK_EXECUTION.labels(task.priority.value).observe(
+                (task.completed_at - task.started_at).total_seconds()
+            )
+        logger.info(f'[WORKER] Flushed {len(completed)} completed tasks')
+        await self.acks.settle(message for _, _, message in items.values())
+
+    async def flush_logged(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f'[WORKER] Completion flush failed: {str(e)}')
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush_logged()
+
+
+class BatchConsumer:
+    def __init__(
+        self,
+        broker: Broker,
+        concurrency: int,
+        batch_size: int,
+        flush_size: int,
+        flush_interval: float,
+    ):
+        self.broker = broker
+        self.batch_size = batch_size
+        # буферизованные сообщения тоже занимают prefetch
+        self.prefetch = concurrency + flush_size
+        self.scheduler = PriorityScheduler(
+            broker, concurrency, prefetch=self.prefetch
+        )
+        self.acks = AckTracker()
+        self.completions = CompletionBuffer(
+            self.acks, flush_size, flush_interval
+        )
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def run(self):
+        flusher = asyncio.create_task(self.completions.run())
+
+        try:
+            async with self.scheduler:
+                while True:
+                    await self.start_batch(await self.next_batch())
+        finally:
+            flusher.cancel()
+            for task in self._in_flight:
+                task.cancel()
+            await self.completions.flush_logged()
+
+    async def next_batch(self) -> list[BrokerMessage]:
+        """Первое сообщение ждём, остальные — пока есть свободные слоты."""
+        batch = [await self.scheduler.next()]
+        while len(batch) < self.batch_size:
+            message = self.scheduler.poll()
+            if message is None:
+                break
+            batch.append(message)
+
+        return batch
+
+    async def settle(self, messages: list[BrokerMessage]):
+        for message in messages:
+            self.scheduler.release(message)
+        await self.acks.settle(messages)
+
+    async def reject(self, messages: list[BrokerMessage], requeue: bool):
+        for message in messages:
+            self.scheduler.release(message)
+        await self.acks.reject(messages, requeue=requeue)
+
+    async def start_batch(self, messages: list[BrokerMessage]):
+        by_task: dict[UUID, BrokerMessage] = {}
+        done: list[BrokerMessage] = []
+        poison: list[BrokerMessage] = []
+        for message in messages:
+            self.acks.track(message)
+            try:
+                task_id = UUID(json.loads(message.body)['task_id'])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f'[WORKER] Malformed message: {str(e)}')
+                poison.append(message)
+                continue
+            if task_id in by_task or cancellations.is_cancelled(task_id):
+                done.append(message)
+            else:
+                by_task[task_id] = message
+        await self.reject(poison, requeue=False)
+
+        try:
+            async for session in get_db_session():
+                tasks = await TaskRepository(session).update_status_many(
+                    list(by_task),
+                    TaskStatus.IN_PROGRESS,
+                    started_at=datetime.now(timezone.utc),
+                    attempts=Task.attempts + 1,
+                    **leases.claim_values(),
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f'[WORKER] Failed to claim batch: {str(e)}')
+            await self.settle(done)
+            await self.reject(list(by_task.values()), requeue=True)
+            return
+
+        claimed = {task.id for task in tasks}
+        # уже не PENDING: взяты другим воркером или отменены
+        done.extend(m for t, m in by_task.items() if t not in claimed)
+        await self.settle(done)
+
+        for task in tasks:
+            observe_queue_wait(task)
+            running = asyncio.create_task(
+                self.run_task(task, by_task[task.id])
+            )
+            self._in_flight.add(running)
+            running.add_done_callback(self._in_flight.discard)
+
+    async def run_task(self, task: Task, message: BrokerMessage):
+        try:
+            with WORKER_TASKS_IN_FLIGHT.track_inprogress():
+                with leases.hold(task.id):
+                    finished, result = await cancellations.run(
+                        task.id, execute_task(task)
+                    )
+        except Exception as e:
+            logger.error(f'Task {task.id} failed: {str(e)}')
+            try:
+                async for session in get_db_session():
+                    await retry_or_fail(
+                        session,
+                        task.id,
+                        task.attempts,
+                        task.max_attempts,
+                        str(e),
+                    )
+            except Exception as e:
+                logger.error(f'[WORKER] Failed to record failure: {str(e)}')
+            await self.acks.settle([message])
+            return
+        finally:
+            # слот свободен, сообщение подтвердится после сброса буфера
+            self.scheduler.release(message)
+
+        if not finished:
+            logger.info(f'[WORKER] Task {task.id} cancelled while running')
+            await self.acks.settle([message])
+            return
+        await self.completions.add(task.id, result, message)
@@ -0,0 +1,69 @@
+"""Отмена задач в воркере.
+
+DELETE /tasks/{id} переводит задачу в CANCELLED, а триггер tasks
+рассылает смену статуса через LISTEN/NOTIFY (см. notifications). Воркер
+по этому уведомлению прерывает выполняющуюся задачу и запоминает id,
+чтобы сообщения уже отменённых задач отбрасывались без обращения к базе.
+"""
+import asyncio
+from collections import OrderedDict
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.task import TaskStatus
+from app.services.notifications import notifier
+
+
+class CancellationRegistry:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # последние отменённые id (строкой, как в сообщениях брокера),
+        # старые вытесняются
+        self._cancelled: OrderedDict[str, None] = OrderedDict()
+        self._running: dict[UUID, asyncio.Task] = {}
+
+    def on_status(self, task_id: UUID, status: TaskStatus):
+        if status != TaskStatus.CANCELLED:
+            return
+        self._cancelled[str(task_id)] = None
+        self._cancelled.move_to_end(str(task_id))
+        while len(self._cancelled) > self.max_size:
+            self._cancelled.popitem(last=False)
+
+        running = self._running.get(task_id)
+        if running is not None and not running.done():
+            logger.info(f'[WORKER] Task {task_id} cancelled, interrupting')
+            running.cancel()
+
+    def is_cancelled(self, task_id: UUID | str) -> bool:
+        return str(task_id) in self._cancelled
+
+    async def run(self, task_id: UUID, coro):
+        """Выполняет coro как отменяемую задачу.
+
+        Возвращает (True, результат) или (False, None), если задачу
+        отменили; отмена самого вызывающего пробрасывается дальше.
+        """
+        work = asyncio.ensure_future(coro)
+        self._running[task_id] = work
+        if self.is_cancelled(task_id):
+            work.cancel()
+        try:
+            return True, await work
+        except asyncio.CancelledError:
+            if not self.is_cancelled(task_id):
+                raise
+            current = asyncio.current_task()
+            # Task.cancelling() появился в Python 3.11, образ собран на 3.10
+            if current is not None and getattr(
+                current, 'cancelling', lambda: 0
+            )():
+                raise
+            return False, None
+        finally:
+            self._running.pop(task_id, None)
+
+
+cancellations = CancellationRegistry(settings.worker_cancelled_cache_size)
+notifier.subscribe(cancellations.on_status)
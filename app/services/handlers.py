@@ -0,0 +1,210 @@
+"""Реестр обработчиков задач по полю type.
+
+Обработчик получает payload задачи и возвращает результат (строку или
+JSON-сериализуемое значение) для колонки result. Где он выполняется,
+задаёт executor:
+
+- async — корутина в цикле событий воркера;
+- thread — блокирующий ввод-вывод в ThreadPoolExecutor;
+- process — CPU-bound работа в ProcessPoolExecutor, функция должна
+  быть объявлена на уровне модуля.
+
+Свои обработчики регистрируются декоратором handlers.register в модулях
+из TASK_HANDLER_MODULES.
+"""
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from enum import Enum
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable
+
+from app.core.config import settings
+from app.models.task import DEFAULT_TASK_TYPE
+
+
+class Executor(str, Enum):
+    ASYNC = 'async'
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
+@dataclass(frozen=True)
+class Handler:
+    func: Callable[[Any], Any]
+    executor: Executor
+    # задач этого типа одновременно на процесс, None — без ограничения
+    concurrency: int | None = None
+
+
+def call_in_process(
+    func: Callable[[Any], Any], ref: bytes | tuple[str, int]
+) -> Any:
+    """Точка входа в процессе пула: payload — pickle inline или в shm."""
+    if isinstance(ref, bytes):
+        return func(pickle.loads(ref))
+
+    name, size = ref
+    # процессы пула делят resource tracker с воркером, сегмент удаляет
+    # воркер после выполнения
+    shm = SharedMemory(name=name)
+    try:
+        # pickle читает прямо из memoryview сегмента, без копии в bytes
+        with shm.buf[:size] as view:
+            payload = pickle.loads(view)
+    finally:
+        shm.close()
+    return func(payload)
+
+
+class HandlerRegistry:
+    def __init__(self):
+        self._handlers: dict[str, Handler] = {}
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._threads: ThreadPoolExecutor | None = None
+        self._processes: ProcessPoolExecutor | None = None
+
+    def register(
+        self,
+        task_type: str,
+        executor: Executor = Executor.ASYNC,
+        concurrency: int | None = None,
+    ):
+        def decorator(func):
+            is_async = executor == Executor.ASYNC
+            if is_async != asyncio.iscoroutinefunction(func):
+                kind = 'a coroutine' if is_async else 'a plain'
+                raise TypeError(
+                    f'Handler {task_type!r} with executor {executor.value} '
+                    f'must be {kind} function'
+                )
+            self._handlers[task_type] = Handler(func, executor, concurrency)
+            return func
+
+        return decorator
+
+    def __contains__(self, task_type: str) -> bool:
+        return task_type in self._handlers
+
+    def get(self, task_type: str) -> Handler:
+        try:
+            return self._handlers[task_type]
+        except KeyError:
+            raise ValueError(f'Unknown task type: {task_type}')
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                settings.handler_thread_pool_size,
+                thread_name_prefix='task-handler',
+            )
+        return self._threads
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(
+                settings.handler_process_pool_size or os.cpu_count(),
+                mp_context=multiprocessing.get_context(
+                    settings.handler_process_start_method
+                ),
+            )
+        return self._processes
+
+    def limit(self, task_type: str) -> asyncio.Semaphore | None:
+        limit = settings.task_type_concurrency.get(
+            task_type, self.get(task_type).concurrency
+        )
+        if not limit:
+            return None
+        if task_type not in self._limits:
+            self._limits[task_type] = asyncio.Semaphore(limit)
+        return self._limits[task_type]
+
+    async def run(self, task_type: str, payload: Any) -> str:
+        handler = self.get(task_type)
+        async with self.limit(task_type) or nullcontext():
+            result = await self._execute(handler, payload)
+
+        return result if isinstance(result, str) else json.dumps(result)
+
+    async def _execute(self, handler: Handler, payload: Any) -> Any:
+        if handler.executor == Executor.ASYNC:
+            return await handler.func(payload)
+        if handler.executor == Executor.THREAD:
+            return await self._submit(self.thread_pool, handler.func, payload)
+
+        # Аргументы процессу пиклятся и идут через pipe. Большой payload
+        # пиклится один раз и копируется в shared memory, процесс получает
+        # имя и длину.
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) < settings.handler_shared_memory_threshold:
+            return await self._submit(
+                self.process_pool, call_in_process, handler.func, data
+            )
+        shm = SharedMemory(create=True, size=len(data))
+        try:
+            shm.buf[: len(data)] = data
+            return await self._submit(
+                self.process_pool,
+                call_in_process,
+                handler.func,
+                (shm.name, len(data)),
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def _submit(
+        self, pool: ThreadPoolExecutor | ProcessPoolExecutor, func, *args
+    ) -> Any:
+        """Выполняет func в пуле; отмена ждёт уже начатую работу.
+
+        Поток или процесс пула не прервать: пока работа идёт, задача
+        занимает слот воркера и семафор своего типа, а shared memory
+        не удаляется.
+        """
+        future = pool.submit(func, *args)
+        waiter = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # ещё не начатая работа просто снимается с очереди пула
+            if not future.cancel():
+                await asyncio.wait([waiter])
+                waiter.exception()
+            raise
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+
+handlers = HandlerRegistry()
+
+
+@handlers.register(DEFAULT_TASK_TYPE)
+async def sleep(payload: dict | None) -> str:
+    """Ждёт payload['seconds'] (по умолчанию 25) x TASK_DURATION_SCALE."""
+    seconds = (payload or {}).get('seconds', 25)
+    await asyncio.sleep(seconds * settings.task_duration_scale)
+    return 'Success'
+
+
+def load_handler_modules():
+    for module in settings.task_handler_modules:
+        importlib.import_module(module)
+
+
+load_handler_modules()
@@ -0,0 +1,139 @@
+"""Аренда задач воркерами.
+
+Взятая задача получает worker_id и lease_expires_at. Пока воркер жив,
+он продлевает аренду всех своих задач одним UPDATE раз в
+WORKER_HEARTBEAT_INTERVAL. Reaper (в каждом воркере, конкурентно через
+SKIP LOCKED) находит задачи с истёкшей арендой по частичному индексу и
+возвращает их в очередь, а исчерпавшие попытки — в FAILED.
+"""
+import asyncio
+import os
+import socket
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from uuid import UUID, uuid4
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import get_db_session
+from app.models.task import TaskStatus
+from app.repositories.outbox import OutboxRepository
+from app.repositories.task import TaskRepository
+
+LEASE_EXPIRED = 'Lease expired: worker stopped heartbeating'
+
+
+class LeaseKeeper:
+    def __init__(self):
+        self._pid: int | None = None
+        self._worker_id = ''
+        self.held: set[UUID] = set()
+
+    @property
+    def worker_id(self) -> str:
+        # Процессы воркера порождаются fork: id вычисляется в каждом
+        # процессе заново, а не наследуется от родителя.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker_id = (
+                f'{socket.gethostname()}:{self._pid}:{uuid4().hex[:8]}'
+            )
+            self.held = set()
+        return self._worker_id
+
+    @staticmethod
+    def expires_at() -> datetime:
+        return datetime.now(timezone.utc) + timedelta(
+            seconds=settings.worker_lease_seconds
+        )
+
+    def claim_values(self) -> dict:
+        """Поля, которые ставятся задаче при переходе в IN_PROGRESS."""
+        return {
+            'worker_id': self.worker_id,
+            'lease_expires_at': self.expires_at(),
+        }
+
+    @contextmanager
+    def hold(self, task_id: UUID) -> Iterator[None]:
+        """Аренда task_id продлевается, пока блок выполняется."""
+        self.held.add(task_id)
+        try:
+            yield
+        finally:
+            self.held.discard(task_id)
+
+    async def renew(self, session: AsyncSession) -> int:
+        renewed = await TaskRepository(session).renew_leases(
+            self.worker_id, list(self.held), self.expires_at()
+        )
+        await session.commit()
+
+        return renewed
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.worker_heartbeat_interval)
+            if not self.held:
+                continue
+            try:
+                async for session in get_db_session():
+                    await self.renew(session)
+            except Exception as e:
+                logger.error(f'[WORKER] Lease heartbeat failed: {str(e)}')
+
+
+async def reap_expired(session: AsyncSession, limit: int) -> int:
+    """Возвращает в очередь одну пачку задач с истёкшей арендой."""
+    repo = TaskRepository(session)
+    expired = await repo.lock_expired_leases(
+        datetime.now(timezone.utc), limit
+    )
+    if not expired:
+        await session.rollback()
+        return 0
+
+    retry = [row.id for row in expired if row.attempts < row.max_attempts]
+    exhausted = [
+        row.id for row in expired if row.attempts >= row.max_attempts
+    ]
+    requeued = await repo.update_status_many(
+        retry,
+        TaskStatus.PENDING,
+        from_statuses={TaskStatus.IN_PROGRESS},
+        error=LEASE_EXPIRED,
+    )
+    await OutboxRepository(session).add(requeued)
+    await repo.update_status_many(
+        exhausted,
+        TaskStatus.FAILED,
+        from_statuses={TaskStatus.IN_PROGRESS},
+        error=LEASE_EXPIRED,
+    )
+    await session.commit()
+    logger.warning(
+        f'[REAPER] Requeued {len(requeued)} and failed {len(exhausted)} '
+        f'tasks with expired leases'
+    )
+
+    return len(expired)
+
+
+async def reaper():
+    while True:
+        reaped = 0
+        try:
+            async for session in get_db_session():
+                reaped = await reap_expired(
+                    session, settings.reaper_batch_size
+                )
+        except Exception as e:
+            logger.error(f'[REAPER] Reaper iteration failed: {str(e)}')
+        if reaped < settings.reaper_batch_size:
+            await asyncio.sleep(settings.reaper_interval)
+
+
+leases = LeaseKeeper()
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Callable
+from uuid import UUID
+
+import asyncpg
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.task import TaskStatus
+
+STATUS_CHANNEL = 'task_status'
+
+StatusListener = Callable[[UUID, TaskStatus], None]
+
+
+class StatusNotifier:
+    """Раздаёт изменения статусов задач подписчикам внутри процесса."""
+
+    def __init__(self):
+        self._listeners: list[StatusListener] = []
+        self._reset_listeners: list[Callable[[], None]] = []
+
+    def subscribe(self, listener: StatusListener):
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: StatusListener):
+        self._listeners.remove(listener)
+
+    def subscribe_reset(self, listener: Callable[[], None]):
+        """Подписка на потерю уведомлений (например, переподключение)."""
+        self._reset_listeners.append(listener)
+
+    def dispatch(self, task_id: UUID, status: TaskStatus):
+        for listener in list(self._listeners):
+            try:
+                listener(task_id, status)
+            except Exception as e:
+                logger.error(f'Status listener failed for {task_id}: {e}')
+
+    def reset(self):
+        for listener in list(self._reset_listeners):
+            listener()
+
+
+notifier = StatusNotifier()
+
+
+def record_status_change(
+    session: Session, task_id: UUID, status: TaskStatus
+):
+    """Запоминает изменение статуса до коммита сессии."""
+    session.info.setdefault('status_changes', []).append((task_id, status))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_committed_changes(session: Session):
+    for task_id, status in session.info.pop('status_changes', []):
+        notifier.dispatch(task_id, status)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_changes(session: Session):
+    session.info.pop('status_changes', None)
+
+
+class LocalBackend:
+    """Только изменения, закоммиченные в этом процессе."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresBackend:
+    """LISTEN на канал, в который пишет триггер таблицы tasks.
+
+    Триггер шлёт NOTIFY '<id>:<status>' при каждом коммите, меняющем
+    статус, поэтому уведомления приходят от всех процессов и реплик.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._connection: asyncpg.Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        await self._connect()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+
+    async def _connect(self):
+        self._connection = await asyncpg.connect(self.dsn)
+        self._connection.add_termination_listener(self._on_terminated)
+        await self._connection.add_listener(STATUS_CHANNEL, self._on_notify)
+        # Пока не было соединения, уведомления могли потеряться.
+        notifier.reset()
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        task_id, _, status = payload.partition(':')
+        try:
+            notifier.dispatch(UUID(task_id), TaskStatus(status))
+        except ValueError:
+            logger.error(f'Malformed status notification: {payload}')
+
+    def _on_terminated(self, connection):
+        if not self._stopping:
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping:
+            try:
+                await self._connect()
+                logger.info('Status listener reconnected')
+                return
+            except Exception as e:
+                logger.error(f'Status listener reconnect failed: {e}')
+                await asyncio.sleep(self.reconnect_delay)
+
+
+def get_notification_backend() -> LocalBackend | PostgresBackend:
+    if settings.notification_backend == 'postgres':
+        return PostgresBackend(settings.sync_database_url)
+    return LocalBackend()
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.brokers import get_broker
+from app.core.config import settings
+from app.core.lifecycle import publishes
+from app.core.logger import logger
+from app.db.session import get_db_session
+from app.repositories.outbox import OutboxRepository
+
+
+async def relay_batch(session: AsyncSession) -> int:
+    """Публикует одну пачку из outbox и помечает её отправленной.
+
+    Строки остаются заблокированными до коммита, поэтому несколько
+    релеев могут работать параллельно, не публикуя одно и то же дважды.
+    """
+    repo = OutboxRepository(session)
+    messages = await repo.fetch_unsent(settings.outbox_batch_size)
+    if not messages:
+        await session.rollback()
+        return 0
+
+    errors = await get_broker().publish_batch(
+        [(str(message.task_id), message.priority) for message in messages]
+    )
+    sent = [m.id for m, error in zip(messages, errors) if error is None]
+    for message, error in zip(messages, errors):
+        if error is not None:
+            logger.error(
+                f'[RELAY] Failed to publish task {message.task_id}: '
+                f'{str(error)}'
+            )
+
+    await repo.mark_sent(sent)
+    await session.commit()
+
+    return len(sent)
+
+
+async def purge_sent(session: AsyncSession) -> int:
+    repo = OutboxRepository(session)
+    older_than = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.outbox_retention_seconds
+    )
+    purged = await repo.purge_sent(older_than)
+    await session.commit()
+
+    return purged
+
+
+async def main():
+    logger.info('[RELAY] Outbox relay started')
+    last_purge = asyncio.get_running_loop().time()
+
+    while True:
+        try:
+            async for session in get_db_session():
+                # остановка API дожидается публикуемой пачки
+                with publishes.track():
+                    sent = await relay_batch(session)
+
+                now = asyncio.get_running_loop().time()
+                if now - last_purge > settings.outbox_retention_seconds:
+                    await purge_sent(session)
+                    last_purge = now
+        except Exception as e:
+            logger.error(f'[RELAY] Relay iteration failed: {str(e)}')
+            sent = 0
+
+        if sent < settings.outbox_batch_size:
+            await asyncio.sleep(settings.outbox_poll_interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
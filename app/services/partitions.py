@@ -0,0 +1,262 @@
+"""Обслуживание секций tasks.
+
+Создаёт месячные секции наперёд и архивирует секции старше
+ARCHIVE_AFTER_DAYS: завершённые задачи переносятся в tasks_archive (или
+выгружаются в файл), незавершённые возвращаются в горячую таблицу.
+Заодно удаляет поминутную статистику старше STATS_SERIES_RETENTION_DAYS.
+Запускается по расписанию:
+
+    python -m app.services.partitions
+    python -m app.services.partitions --export-dir /backups/tasks
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import get_db_session
+from app.models.task import TERMINAL_STATUSES, Task
+from app.repositories.idempotency import IdempotencyRepository
+from app.repositories.stats import StatsRepository
+
+PARTITION_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+# Postgres пишет смещение как +00 и дробную часть без ведущих нулей;
+# datetime.fromisoformat до Python 3.11 принимает только +00:00 и 3/6 цифр
+BOUND_TIMESTAMP = re.compile(
+    r"^(?P<base>[\d-]+ [\d:]+)(?:\.(?P<fraction>\d+))?"
+    r"(?P<sign>[+-])(?P<hours>\d\d):?(?P<minutes>\d\d)?$"
+)
+COLUMNS = ', '.join(column.name for column in Task.__table__.columns)
+TERMINAL = ', '.join(f"'{status.value}'" for status in TERMINAL_STATUSES)
+
+
+@dataclass
+class Partition:
+    name: str
+    # None — MINVALUE/MAXVALUE или секция по умолчанию
+    lower: datetime | None
+    upper: datetime | None
+    is_default: bool = False
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f'tasks_p{start:%Y_%m}'
+
+
+def parse_bound(value: str) -> datetime | None:
+    value = value.strip("'")
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    match = BOUND_TIMESTAMP.match(value)
+    if match:
+        fraction = (match['fraction'] or '0')[:6].ljust(6, '0')
+        value = (
+            f"{match['base']}.{fraction}"
+            f"{match['sign']}{match['hours']}:{match['minutes'] or '00'}"
+        )
+    return datetime.fromisoformat(value)
+
+
+def parse_partition(name: str, bound: str) -> Partition:
+    if bound == 'DEFAULT':
+        return Partition(name, None, None, is_default=True)
+
+    match = PARTITION_BOUND.search(bound)
+    if not match:
+        raise ValueError(f'Unexpected partition bound for {name}: {bound}')
+    return Partition(name, parse_bound(match[1]), parse_bound(match[2]))
+
+
+def months_to_create(
+    partitions: list[Partition], now: datetime, months_ahead: int
+) -> list[datetime]:
+    """Начала месяцев от текущего до now + months_ahead без секции."""
+    covered = max(
+        (p.upper for p in partitions if p.upper is not None),
+        default=None,
+    )
+    months = [
+        add_months(month_start(now), offset)
+        for offset in range(months_ahead + 1)
+    ]
+
+    return [start for start in months if covered is None or start >= covered]
+
+
+async def list_partitions(session: AsyncSession) -> list[Partition]:
+    result = await session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'tasks'::regclass ORDER BY c.relname"
+        )
+    )
+
+    return [parse_partition(name, bound) for name, bound in result.all()]
+
+
+async def create_partitions(
+    session: AsyncSession, months_ahead: int, now: datetime | None = None
+) -> list[str]:
+    now = now or datetime.now(timezone.utc)
+    created = []
+    for start in months_to_create(
+        await list_partitions(session), now, months_ahead
+    ):
+        name = partition_name(start)
+        await session.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF tasks "
+                f"FOR VALUES FROM ('{start.isoformat()}') "
+                f"TO ('{add_months(start, 1).isoformat()}')"
+            )
+        )
+        created.append(name)
+    await session.commit()
+
+    return created
+
+
+async def export_partition(
+    session: AsyncSession, name: str, export_dir: str
+) -> str:
+    """Выгружает завершённые задачи секции в gzip JSON Lines."""
+    path = os.path.join(export_dir, f'{name}.jsonl.gz')
+    tmp_path = f'{path}.tmp'
+    result = await session.stream(
+        text(f'SELECT {COLUMNS} FROM {name} WHERE status IN ({TERMINAL})')
+    )
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        async for row in result.mappings():
+            f.write(json.dumps(dict(row), default=str) + '\n')
+    os.replace(tmp_path, path)
+    await session.commit()
+
+    return path
+
+
+async def archive_partition(
+    session: AsyncSession, partition: Partition, export_dir: str | None
+):
+    """Переносит секцию в холодное хранение.
+
+    Копирование идёт до DETACH и не блокирует tasks; сам DETACH, возврат
+    незавершённых задач и DROP — одна короткая транзакция под
+    ACCESS EXCLUSIVE. Строки, успевшие стать активными после копирования,
+    удаляются из архива.
+    """
+    name = partition.name
+    if export_dir:
+        path = await export_partition(session, name, export_dir)
+        logger.info(f'[PARTITIONS] Exported {name} to {path}')
+    else:
+        await session.execute(
+            text(
+                f'INSERT INTO tasks_archive ({COLUMNS}) '
+                f'SELECT {COLUMNS} FROM {name} '
+                f'WHERE status IN ({TERMINAL}) ON CONFLICT (id) DO NOTHING'
+            )
+        )
+        await session.commit()
+
+    await session.execute(text(f'ALTER TABLE tasks DETACH PARTITION {name}'))
+    active = f'SELECT id FROM {name} WHERE status NOT IN ({TERMINAL})'
+    await session.execute(
+        text(f'DELETE FROM tasks_archive WHERE id IN ({active})')
+    )
+    # старого диапазона больше нет, строки уходят в секцию по умолчанию
+    await session.execute(
+        text(
+            f'INSERT INTO tasks ({COLUMNS}) SELECT {COLUMNS} FROM {name} '
+            f'WHERE status NOT IN ({TERMINAL})'
+        )
+    )
+    await session.execute(text(f'DROP TABLE {name}'))
+    await session.commit()
+
+
+async def archive_partitions(
+    session: AsyncSession, before: datetime, export_dir: str | None = None
+) -> list[str]:
+    """Архивирует секции, целиком лежащие раньше before."""
+    archived = []
+    for partition in await list_partitions(session):
+        if partition.is_default or partition.upper is None:
+            continue
+        if partition.upper <= before:
+            await archive_partition(session, partition, export_dir)
+            archived.append(partition.name)
+
+    return archived
+
+
+async def main(months_ahead: int, archive_after_days: int, export_dir: str):
+    async for session in get_db_session():
+        if session.get_bind().dialect.name != 'postgresql':
+            raise SystemExit('Table partitioning requires PostgreSQL')
+
+        created = await create_partitions(session, months_ahead)
+        logger.info(f'[PARTITIONS] Created: {created or "none"}')
+
+        before = datetime.now(timezone.utc) - timedelta(
+            days=archive_after_days
+        )
+        archived = await archive_partitions(session, before, export_dir)
+        logger.info(f'[PARTITIONS] Archived: {archived or "none"}')
+
+        purged = await StatsRepository(session).purge_series(
+            timedelta(days=settings.stats_series_retention_days)
+        )
+        await session.commit()
+        logger.info(f'[PARTITIONS] Purged {purged} stats series rows')
+
+        purged = await IdempotencyRepository(session).purge_expired()
+        await session.commit()
+        logger.info(f'[PARTITIONS] Purged {purged} expired idempotency keys')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Tasks partition maintenance')
+    parser.add_argument(
+        '--months-ahead',
+        type=int,
+        default=settings.partition_months_ahead,
+        help='Monthly partitions to keep created in advance.',
+    )
+    parser.add_argument(
+        '--archive-after-days',
+        type=int,
+        default=settings.archive_after_days,
+        help='Archive partitions whose range ended this long ago.',
+    )
+    parser.add_argument(
+        '--export-dir',
+        help='Export finished tasks to gzip JSON Lines files here '
+        'instead of moving them into tasks_archive.',
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(
+        main(args.months_ahead, args.archive_after_days, args.export_dir)
+    )
@@ -0,0 +1,156 @@
+"""Планировщик воркера поверх очередей по приоритетам.
+
+Из каждой очереди PRIORITY_QUEUES сообщения забираются в локальный
+буфер, следующее для запуска выбирается так:
+
+- уровни с ожидающими сообщениями делят слоты по весам
+  (smooth weighted round-robin), поэтому LOW получает свою долю даже
+  под постоянной нагрузкой HIGH;
+- сообщение поднимается на уровень за каждые aging_interval секунд
+  ожидания с момента публикации;
+- reserved_high слотов занимают только задачи HIGH, чтобы их задержка
+  не зависела от очереди остальных.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Mapping
+
+from app.brokers.base import PRIORITY_QUEUES, Broker, BrokerMessage
+from app.core.config import settings
+from app.core.metrics import SCHEDULER_BUFFERED, SCHEDULER_WAIT
+from app.models.task import TaskPriority
+
+HIGH = TaskPriority.HIGH.numeric
+PRIORITY_NAMES = {p.numeric: p.value for p in TaskPriority}
+
+
+def weights_from_settings() -> dict[int, int]:
+    return {
+        TaskPriority(name).numeric: weight
+        for name, weight in settings.scheduler_weights.items()
+    }
+
+
+class PriorityScheduler:
+    """Выдаёт сообщения в порядке запуска; каждое занимает слот до release."""
+
+    def __init__(
+        self,
+        broker: Broker,
+        concurrency: int,
+        prefetch: int,
+        weights: Mapping[int, int] | None = None,
+        reserved_high: int | None = None,
+        aging_interval: float | None = None,
+    ):
+        self.broker = broker
+        self.concurrency = concurrency
+        self.prefetch = prefetch
+        self.weights = dict(weights or weights_from_settings())
+        if reserved_high is None:
+            reserved_high = settings.scheduler_reserved_high
+        # хотя бы один слот остаётся остальным приоритетам
+        self.reserved_high = min(reserved_high, concurrency - 1)
+        if aging_interval is None:
+            aging_interval = settings.scheduler_aging_interval
+        self.aging_interval = aging_interval
+
+        self.buffers: dict[int, deque[BrokerMessage]] = {
+            priority: deque() for priority in PRIORITY_QUEUES
+        }
+        self.running: Counter[int] = Counter()
+        self._slots: dict[int, int] = {}
+        self._credit: Counter[int] = Counter()
+        self._changed = asyncio.Event()
+        self._pumps: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> 'PriorityScheduler':
+        self._pumps = [
+            asyncio.create_task(self._pump(priority, queue))
+            for priority, queue in PRIORITY_QUEUES.items()
+        ]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for pump in self._pumps:
+            pump.cancel()
+        await asyncio.gather(*self._pumps, return_exceptions=True)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BrokerMessage:
+        return await self.next()
+
+    async def _pump(self, priority: int, queue: str):
+        async for message in self.broker.consume(self.prefetch, queue):
+            self.buffers[priority].append(message)
+            SCHEDULER_BUFFERED.labels(PRIORITY_NAMES[priority]).inc()
+            self._changed.set()
+
+    def level(self, priority: int, message: BrokerMessage, now: float) -> int:
+        if not self.aging_interval:
+            return priority
+        waited = max(now - message.timestamp, 0)
+        return min(priority + int(waited // self.aging_interval), HIGH)
+
+    def has_slot(self, priority: int) -> bool:
+        running = sum(self.running.values())
+        if running >= self.concurrency:
+            return False
+        if priority == HIGH:
+            return True
+        return running - self.running[HIGH] < (
+            self.concurrency - self.reserved_high
+        )
+
+    def poll(self) -> BrokerMessage | None:
+        """Следующее сообщение, если есть и оно может занять слот."""
+        now = time.time()
+        # уровень -> (время публикации, исходный приоритет) самого старого
+        heads: dict[int, tuple[float, int]] = {}
+        for priority, buffer in self.buffers.items():
+            if not buffer or not self.has_slot(priority):
+                continue
+            head = buffer[0]
+            level = self.level(priority, head, now)
+            if level not in heads or head.timestamp < heads[level][0]:
+                heads[level] = (head.timestamp, priority)
+        if not heads:
+            return None
+
+        # smooth weighted round-robin среди уровней с ожидающими задачами
+        total = 0
+        for level in heads:
+            self._credit[level] += self.weights.get(level, 1)
+            total += self.weights.get(level, 1)
+        level = max(heads, key=lambda lvl: (self._credit[lvl], lvl))
+        self._credit[level] -= total
+
+        priority = heads[level][1]
+        message = self.buffers[priority].popleft()
+        self.running[priority] += 1
+        # delivery tag уникален только в пределах одной очереди
+        self._slots[id(message)] = priority
+
+        name = PRIORITY_NAMES[priority]
+        SCHEDULER_BUFFERED.labels(name).dec()
+        SCHEDULER_WAIT.labels(name).observe(max(now - message.timestamp, 0))
+
+        return message
+
+    async def next(self) -> BrokerMessage:
+        while True:
+            message = self.poll()
+            if message is not None:
+                return message
+            self._changed.clear()
+            await self._changed.wait()
+
+    def release(self, message: BrokerMessage):
+        """Освобождает слот сообщения, выданного poll/next."""
+        priority = self._slots.pop(id(message), None)
+        if priority is not None:
+            self.running[priority] -= 1
+            self._changed.set()
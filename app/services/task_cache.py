@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from uuid import UUID
+
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.core.metrics import StatsCollector
+from app.models.task import TERMINAL_STATUSES
+from app.services.notifications import notifier
+
+VIEWS = ('task', 'status')
+
+
+class TaskCache:
+    """Ограниченный LRU/TTL кэш представлений задач.
+
+    Значения — pydantic-схемы с полем status. Задачи в терминальных
+    статусах больше не меняются и живут terminal_ttl, остальные — ttl
+    или до уведомления о смене статуса.
+    """
+
+    def __init__(self, max_size: int, ttl: float, terminal_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, view: str, task_id: UUID) -> Any | None:
+        key = (view, task_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, view: str, task_id: UUID, value: Any):
+        terminal = value.status in TERMINAL_STATUSES
+        ttl = self.terminal_ttl if terminal else self.ttl
+        if ttl <= 0:
+            return
+
+        key = (view, task_id)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(
+        self,
+        view: str,
+        task_id: UUID,
+        loader: Callable[[], Awaitable[Any | None]],
+    ) -> Any | None:
+        value = self.get(view, task_id)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                self.set(view, task_id, value)
+
+        return value
+
+    def invalidate(self, task_id: UUID, *_):
+        for view in VIEWS:
+            self._entries.pop((view, task_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+task_cache = TaskCache(
+    max_size=settings.task_cache_size,
+    ttl=settings.task_cache_ttl,
+    terminal_ttl=settings.task_cache_terminal_ttl,
+)
+REGISTRY.register(StatsCollector('task_cache', task_cache.stats))
+notifier.subscribe(task_cache.invalidate)
+notifier.subscribe_reset(task_cache.clear)
@@ -0,0 +1,92 @@
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+from uuid import UUID
+
+from app.models.task import TaskStatus
+from app.services.notifications import notifier
+
+
+class TaskEventHub:
+    """Раздаёт смены статуса клиентам, ожидающим конкретные задачи.
+
+    Источник событий один на процесс (notifier), поэтому ожидающие
+    клиенты не обращаются к базе, сколько бы их ни было.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[UUID, set[asyncio.Queue]] = defaultdict(set)
+        self.closed = False
+
+    def publish(self, task_id: UUID, status: TaskStatus):
+        for queue in self._subscribers.get(task_id, ()):
+            queue.put_nowait(status)
+
+    def subscribe(self, task_id: UUID) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        if self.closed:
+            queue.put_nowait(None)
+        self._subscribers[task_id].add(queue)
+        return queue
+
+    def close(self):
+        """Будит всех ожидающих None: процесс останавливается.
+
+        Long-poll и SSE завершаются сразу, и остановка не ждёт их до
+        SHUTDOWN_DRAIN_TIMEOUT.
+        """
+        self.closed = True
+        for queues in self._subscribers.values():
+            for queue in queues:
+                queue.put_nowait(None)
+
+    def unsubscribe(self, task_id: UUID, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[task_id]
+
+    @contextmanager
+    def listen(self, task_id: UUID) -> Iterator[asyncio.Queue]:
+        queue = self.subscribe(task_id)
+        try:
+            yield queue
+        finally:
+            self.unsubscribe(task_id, queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+async def next_status(
+    queue: asyncio.Queue, current: TaskStatus
+) -> TaskStatus | None:
+    """Ждёт статус, отличный от current (дубликаты уведомлений пропускаются).
+
+    None — hub закрыт, ждать больше нечего.
+    """
+    while True:
+        status = await queue.get()
+        if status != current:
+            return status
+
+
+def parse_wait(value: str) -> float:
+    """Разбирает длительность вида '30s', '500ms' или '30'."""
+    value = value.strip().lower()
+    try:
+        if value.endswith('ms'):
+            return float(value[:-2]) / 1000
+        if value.endswith('s'):
+            return float(value[:-1])
+        return float(value)
+    except ValueError as e:
+        raise ValueError(f'Invalid wait duration: {value}') from e
+
+
+task_events = TaskEventHub()
+notifier.subscribe(task_events.publish)
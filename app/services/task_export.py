@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Sequence
+from uuid import UUID
+
+from sqlalchemy import Row
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=json_default)
+    return value
+
+
+async def to_ndjson(
+    chunks: AsyncIterator[Sequence[Row]], columns: Sequence[str]
+) -> AsyncIterator[str]:
+    """Одна строка JSON на задачу, одна отправка на пачку строк."""
+    async for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), default=json_default) + '\n'
+            for row in rows
+        )
+
+
+async def to_csv(
+    chunks: AsyncIterator[Sequence[Row]], columns: Sequence[str]
+) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([csv_value(v) for v in row] for row in rows)
+        yield buffer.getvalue()
+
+
+SERIALIZERS = {'ndjson': to_ndjson, 'csv': to_csv}
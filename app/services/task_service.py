@@ -1,59 +1,89 @@
-import asyncio
-import json
+import random
 from datetime import datetime, timezone
 from uuid import UUID
 
-import aio_pika
-from aio_pika.pool import Pool
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.logger import logger
-from app.models.task import TaskPriority, TaskStatus
+from app.core.metrics import TASK_EXECUTION, TASK_QUEUE_WAIT
+from app.models.task import Task, TaskStatus
+from app.repositories.outbox import OutboxRepository
 from app.repositories.task import TaskRepository
+from app.services.cancellation import cancellations
+from app.services.handlers import handlers
+from app.services.leases import leases
+
+
+def retry_delay(attempt: int) -> float:
+    """Экспоненциальная задержка перед повтором номер attempt.
+
+    Случайная половина задержки (equal jitter) разводит повторы задач,
+    упавших одновременно.
+    """
+    delay = min(
+        settings.task_retry_base_delay * 2 ** (attempt - 1),
+        settings.task_retry_max_delay,
+    )
+    return random.uniform(delay / 2, delay)
+
+
+async def retry_or_fail(
+    session: AsyncSession,
+    task_id: UUID,
+    attempts: int,
+    max_attempts: int,
+    error: str,
+):
+    """Возвращает задачу в очередь с задержкой или переводит в FAILED.
+
+    Повтор публикуется через outbox с available_at в будущем, поэтому
+    ни воркер, ни брокер не держат сообщение на время backoff.
+    """
+    repo = TaskRepository(session)
+    if attempts < max_attempts:
+        task = await repo.update_status(
+            task_id,
+            TaskStatus.PENDING,
+            from_statuses={TaskStatus.IN_PROGRESS},
+            owned_by=leases.worker_id,
+            error=error,
+        )
+        if task:
+            delay = retry_delay(attempts)
+            await OutboxRepository(session).add([task], delay=delay)
+            logger.info(
+                f'[WORKER] Task {task_id} will be retried in {delay:.1f}s '
+                f'(attempt {attempts}/{max_attempts})'
+            )
+    else:
+        await repo.update_status(
+            task_id,
+            TaskStatus.FAILED,
+            owned_by=leases.worker_id,
+            error=error,
+        )
+        logger.error(
+            f'[WORKER] Task {task_id} moved to dead-letter after '
+            f'{attempts} attempts'
+        )
+    await session.commit()
 
-QUEUE_NAME = 'tasks_queue'
-
-
-async def get_connection():
-    return await aio_pika.connect_robust(settings.rabbitmq_url)
-
-
-connection_pool = Pool(get_connection, max_size=10)
-
-
-async def publish_task(task_id: str, priority: int, session: AsyncSession):
-    try:
-        repo = TaskRepository(session)
-
-        async with connection_pool.acquire() as connection:
-            async with connection.channel() as channel:
-                await channel.declare_queue(
-                    QUEUE_NAME, durable=True, arguments={'x-max-priority': 10}
-                )
-
-                task = await repo.get(UUID(task_id))
 
-                if not task:
-                    logger.error(f'Task with ID {task_id} not found.')
-                    return
+def observe_queue_wait(task: Task):
+    TASK_QUEUE_WAIT.labels(task.priority.value).observe(
+        (task.started_at - task.created_at).total_seconds()
+    )
 
-                if task.status != TaskStatus.PENDING:
-                    await repo.update_status(task, TaskStatus.PENDING)
-                    await session.commit()
 
-                message = aio_pika.Message(
-                    body=json.dumps({'task_id': task_id}).encode(),
-                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                    priority=priority,
-                )
-                await channel.default_exchange.publish(
-                    message, routing_key=QUEUE_NAME
-                )
+async def execute_task(task: Task) -> str:
+    """Выполняет задачу обработчиком её типа; результат — в колонку result."""
+    logger.info(
+        f'[WORKER] Task {task.id} of type {task.type} started with '
+        f'priority {task.priority.numeric}'
+    )
 
-    except Exception as e:
-        logger.error(f'Failed to publish task {task_id}: {str(e)}')
-        raise
+    return await handlers.run(task.type, task.payload)
 
 
 async def process_task(session: AsyncSession, task_id: str):
@@ -62,60 +92,52 @@ async def process_task(session: AsyncSession, task_id: str):
 
     try:
         task_uuid = UUID(task_id)
-        task = await repo.get(task_uuid)
-
-        logger.info(f'[WORKER] Got task: {task}')
+        task = await repo.update_status(
+            task_uuid,
+            TaskStatus.IN_PROGRESS,
+            started_at=datetime.now(timezone.utc),
+            attempts=Task.attempts + 1,
+            **leases.claim_values(),
+        )
+        if task:
+            # после rollback объект будет просрочен, поля читаем заранее
+            attempts, max_attempts = task.attempts, task.max_attempts
+        await session.commit()
 
         if not task:
+            logger.info(f'[WORKER] Task {task_id} is not pending, skipping')
             return
 
-        if task.status == TaskStatus.NEW:
-            await repo.update_status(task, TaskStatus.PENDING)
-            await session.commit()
-
-        if task.status != TaskStatus.PENDING:
-            return
-
-        try:
-            if isinstance(task.priority, TaskPriority):
-                priority = task.priority.numeric
-            else:
-                priority = TaskPriority(task.priority).numeric
-        except ValueError:
-            logger.error(
-                f'[WORKER] Invalid priority for task {task.id}: {task.priority}'
-            )
-            await repo.update_status(
-                task,
-                TaskStatus.FAILED,
-                error=f'Invalid priority: {task.priority}',
+        observe_queue_wait(task)
+        with leases.hold(task.id):
+            finished, result = await cancellations.run(
+                task.id, execute_task(task)
             )
-            await session.commit()
+        if not finished:
+            logger.info(f'[WORKER] Task {task.id} cancelled while running')
             return
 
-        await repo.update_status(
-            task, TaskStatus.IN_PROGRESS, started_at=datetime.now(timezone.utc)
-        )
-        await session.commit()
-        logger.info(
-            f'[WORKER] Task {task.id} started with priority {priority}'
-        )
-
-        duration = max(1, 30 - priority * 2)
-        logger.info(f'[WORKER] Sleeping for {duration} seconds')
-        await asyncio.sleep(duration)
-
-        await repo.update_status(
-            task,
+        completed = await repo.update_status(
+            task.id,
             TaskStatus.COMPLETED,
+            owned_by=leases.worker_id,
             completed_at=datetime.now(timezone.utc),
-            result='Success',
+            result=result,
         )
         await session.commit()
+        if not completed:
+            # отменена или отдана другому воркеру после потери аренды
+            logger.info(f'[WORKER] Task {task.id} is no longer in progress')
+            return
+        TASK_EXECUTION.labels(task.priority.value).observe(
+            (completed.completed_at - completed.started_at).total_seconds()
+        )
         logger.info(f'[WORKER] Task {task.id} completed successfully')
 
     except Exception as e:
         logger.error(f'Task {task_id} failed: {str(e)}')
         if task:
-            await repo.update_status(task, TaskStatus.FAILED, error=str(e))
-            await session.commit()
+            await session.rollback()
+            await retry_or_fail(
+                session, task_uuid, attempts, max_attempts, str(e)
+            )
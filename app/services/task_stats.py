@@ -0,0 +1,66 @@
+"""Сборка ответа GET /tasks/stats из счётчиков StatsRepository."""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+from sqlalchemy import Row
+
+from app.models.task import TaskPriority, TaskStatus
+from app.repositories.stats import (
+    RUN_COUNT,
+    RUN_SECONDS,
+    WAIT_COUNT,
+    WAIT_SECONDS,
+)
+from app.schemas.task import TaskStatsBucketOut, TaskStatsOut
+
+
+def average(total: float, count: float) -> float | None:
+    return round(total / count, 3) if count else None
+
+
+def build_stats(rows: Sequence[Row]) -> TaskStatsOut:
+    by_priority = {
+        priority: {status: 0 for status in TaskStatus}
+        for priority in TaskPriority
+    }
+    sums: dict[str, float] = defaultdict(float)
+    for row in rows:
+        if row.name in TaskStatus.__members__:
+            by_priority[row.priority][TaskStatus(row.name)] = int(row.value)
+        else:
+            sums[row.name] += row.value
+
+    by_status = {
+        status: sum(counts[status] for counts in by_priority.values())
+        for status in TaskStatus
+    }
+
+    return TaskStatsOut(
+        total=sum(by_status.values()),
+        by_status=by_status,
+        by_priority=by_priority,
+        avg_wait_seconds=average(sums[WAIT_SECONDS], sums[WAIT_COUNT]),
+        avg_run_seconds=average(sums[RUN_SECONDS], sums[RUN_COUNT]),
+    )
+
+
+def build_series(
+    rows: Sequence[Row], since: datetime, bucket: timedelta
+) -> list[TaskStatsBucketOut]:
+    """Сворачивает поминутные строки в интервалы длиной bucket от since."""
+    buckets: dict[datetime, dict[str, int]] = defaultdict(
+        lambda: defaultdict(int)
+    )
+    for row in rows:
+        minute = row.bucket
+        if minute.tzinfo is None:
+            # SQLite не хранит часовой пояс, время записывается в UTC
+            minute = minute.replace(tzinfo=timezone.utc)
+        start = since + (minute - since) // bucket * bucket
+        buckets[start][row.name] += int(row.value)
+
+    return [
+        TaskStatsBucketOut(bucket=start, counts=counts)
+        for start, counts in sorted(buckets.items())
+    ]
@@ -1,41 +1,218 @@
+import argparse
 import asyncio
 import json
+import multiprocessing
+import os
+import signal
 
-import aio_pika
+from prometheus_client import start_http_server
 
+from app.brokers import get_broker
+from app.brokers.base import (
+    DEAD_LETTER_QUEUE,
+    PRIORITY_QUEUES,
+    Broker,
+    BrokerMessage,
+)
 from app.core.config import settings
 from app.core.logger import logger
+from app.core.metrics import BROKER_QUEUE_DEPTH, WORKER_TASKS_IN_FLIGHT
+from app.db.database import database
 from app.db.session import get_db_session
+from app.services.batch_consumer import BatchConsumer
+from app.services.cancellation import cancellations
+from app.services.handlers import handlers
+from app.services.leases import leases, reaper
+from app.services.notifications import get_notification_backend
+from app.services.scheduler import PriorityScheduler
 from app.services.task_service import process_task
 
-QUEUE_NAME = 'tasks_queue'
+EXIT_SIGNALS = (signal.SIGTERM, signal.SIGINT)
 
 
-async def main():
-    connection = await aio_pika.connect_robust(settings.rabbitmq_url)
-    channel = await connection.channel()
-    await channel.set_qos(prefetch_count=1)
+async def handle_message(message: BrokerMessage):
+    # ack уходит при выходе из process(), т.е. после коммита задачи;
+    # при исключении сообщение уходит в dead-letter, а не по кругу
+    with WORKER_TASKS_IN_FLIGHT.track_inprogress():
+        async with message.process():
+            data = json.loads(message.body)
+            task_id = data.get('task_id')
+            logger.info(f"Received message: {data}")
+            if cancellations.is_cancelled(task_id):
+                logger.info(f'[WORKER] Task {task_id} cancelled, skipping')
+                return
 
-    queue = await channel.declare_queue(
-        QUEUE_NAME,
-        durable=True,
-        arguments={'x-max-priority': 10},
+            async for session in get_db_session():
+                await process_task(session, task_id)
+                logger.info(f"Task {task_id} processed successfully.")
+
+
+async def report_queue_depth(broker: Broker):
+    while True:
+        try:
+            for queue in (*PRIORITY_QUEUES.values(), DEAD_LETTER_QUEUE):
+                BROKER_QUEUE_DEPTH.labels(queue).set(
+                    await broker.queue_depth(queue)
+                )
+        except Exception as e:
+            logger.error(f'Failed to read queue depth: {str(e)}')
+        await asyncio.sleep(settings.queue_depth_interval)
+
+
+async def consume_messages(broker: Broker, concurrency: int):
+    """Обрабатывает сообщения по одному, не больше concurrency одновременно.
+
+    Порядок запуска выбирает PriorityScheduler.
+    """
+    in_flight: set[asyncio.Task] = set()
+
+    async with PriorityScheduler(
+        broker, concurrency, prefetch=concurrency
+    ) as scheduler:
+        async for message in scheduler:
+            task = asyncio.create_task(handle_message(message))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(
+                lambda _, message=message: scheduler.release(message)
+            )
+
+
+async def consume(broker: Broker, concurrency: int, batch_size: int = 0):
+    """batch_size > 1 включает пакетный режим (app.services.batch_consumer)."""
+    background = [
+        asyncio.create_task(report_queue_depth(broker)),
+        asyncio.create_task(leases.heartbeat()),
+        asyncio.create_task(reaper()),
+    ]
+
+    try:
+        if batch_size > 1:
+            await BatchConsumer(
+                broker,
+                concurrency,
+                batch_size,
+                settings.worker_flush_size,
+                settings.worker_flush_interval,
+            ).run()
+        else:
+            await consume_messages(broker, concurrency)
+    finally:
+        for task in background:
+            task.cancel()
+
+
+async def main(concurrency: int = 1, batch_size: int = 0):
+    broker = get_broker()
+    await asyncio.gather(
+        broker.connect(), database.warm_up(settings.db_pool_warmup)
     )
+    # смены статуса других процессов: по CANCELLED прерываем задачу
+    notifications = get_notification_backend()
+    await notifications.start()
     logger.info(
-        f"Queue '{QUEUE_NAME}' declared and ready to consume messages."
+        f"Consuming {', '.join(PRIORITY_QUEUES.values())} from "
+        f"{settings.broker_backend} "
+        f"(concurrency={concurrency}, batch_size={batch_size})."
     )
 
-    async with queue.iterator() as queue_iter:
-        async for message in queue_iter:
-            async with message.process():
-                data = json.loads(message.body)
-                task_id = data.get('task_id')
-                logger.info(f"Received message: {data}")
+    try:
+        await consume(broker, concurrency, batch_size)
+    finally:
+        await notifications.stop()
+        await broker.close()
+        await database.dispose()
+        handlers.shutdown()
+
+
+def run_worker(concurrency: int, batch_size: int, index: int = 0):
+    # обработчики и маска сигналов supervise наследуются через fork;
+    # процесс воркера останавливается по terminate() как обычно
+    for sig in EXIT_SIGNALS:
+        signal.signal(sig, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, EXIT_SIGNALS)
+    if settings.worker_metrics_port:
+        start_http_server(settings.worker_metrics_port + index)
+    asyncio.run(main(concurrency, batch_size))
 
-                async for session in get_db_session():
-                    await process_task(session, task_id)
-                    logger.info(f"Task {task_id} processed successfully.")
+
+def supervise(concurrency: int, batch_size: int, processes: int):
+    """Запускает processes воркеров и перезапускает упавшие."""
+    stopping = False
+    workers: list[multiprocessing.Process] = []
+
+    def spawn(index: int) -> multiprocessing.Process:
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(concurrency, batch_size, index),
+            name=f'worker-{index}',
+        )
+        # пока воркер не сбросил обработчики, сигналы остановки ждут
+        signal.pthread_sigmask(signal.SIG_BLOCK, EXIT_SIGNALS)
+        try:
+            process.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, EXIT_SIGNALS)
+        logger.info(f'Started {process.name} (pid={process.pid})')
+        return process
+
+    def stop(signum, frame):
+        # воркеры останавливает основной цикл: сигнал может прийти, пока
+        # workers ещё заполняется
+        nonlocal stopping
+        stopping = True
+
+    for sig in EXIT_SIGNALS:
+        signal.signal(sig, stop)
+
+    for index in range(processes):
+        workers.append(spawn(index))
+
+    while not stopping:
+        for index, process in enumerate(workers):
+            process.join(timeout=1 / len(workers))
+            if not stopping and not process.is_alive():
+                logger.error(
+                    f'{process.name} exited with code {process.exitcode}, '
+                    f'restarting'
+                )
+                workers[index] = spawn(index)
+
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Task queue worker')
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=settings.worker_concurrency,
+        help='Concurrent in-flight tasks per process (prefetch_count).',
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=settings.worker_processes,
+        help='Worker processes to fork, 0 means one per CPU core.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=settings.worker_batch_size,
+        help='Claim up to this many tasks per DB round trip; 0 or 1 '
+        'processes messages one by one.',
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    processes = args.processes or os.cpu_count() or 1
+
+    if processes == 1:
+        run_worker(args.concurrency, args.batch_size)
+    else:
+        supervise(args.concurrency, args.batch_size, processes)
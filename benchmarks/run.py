@@ -0,0 +1,419 @@
+"""Воспроизводимые бенчмарки API и воркера.
+
+API гоняется в процессе через httpx.ASGITransport, воркер — через
+handle_message поверх локальной базы и MemoryBroker. Результаты
+пишутся в JSON и могут сравниваться с сохранённым baseline:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from app.brokers import get_broker
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.metrics import timed
+from app.db.database import Base
+from app.db.session import get_db_session
+from app.main import app
+from app.services import outbox_relay, worker
+from app.services.scheduler import PriorityScheduler
+
+SCENARIOS = (
+    'create',
+    'batch_create',
+    'list',
+    'status',
+    'relay',
+    'consume',
+    'instrumentation',
+)
+PRIORITIES = ('LOW', 'MEDIUM', 'HIGH')
+
+
+@dataclass
+class Samples:
+    latencies: list[float] = field(default_factory=list)
+    operations: int = 0
+    elapsed: float = 0.0
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.latencies)
+        index = round(p / 100 * (len(ordered) - 1))
+        return ordered[index] * 1000
+
+    def summary(self) -> dict[str, float]:
+        return {
+            'count': len(self.latencies),
+            'operations': self.operations,
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'ops_per_sec': round(self.operations / self.elapsed, 1),
+        }
+
+
+async def measure(
+    operation: Callable[[int], Awaitable[int | None]],
+    count: int,
+    concurrency: int,
+) -> Samples:
+    """Выполняет operation count раз, не более concurrency одновременно.
+
+    operation возвращает число обработанных задач (по умолчанию 1).
+    """
+    samples = Samples()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            operations = await operation(index)
+            samples.latencies.append(time.perf_counter() - start)
+            samples.operations += operations or 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(index) for index in range(count)))
+    samples.elapsed = time.perf_counter() - started
+
+    return samples
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.task_ids: list[str] = []
+        self.engine = create_async_engine(
+            args.database_url, connect_args=self.connect_args()
+        )
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine.sync_engine, 'connect', self.set_wal)
+        self.sessionmaker = async_sessionmaker(
+            bind=self.engine, expire_on_commit=False, class_=AsyncSession
+        )
+        settings.broker_backend = 'memory'
+        self.broker = get_broker()
+
+    def connect_args(self) -> dict:
+        if self.args.database_url.startswith('sqlite'):
+            return {'timeout': 30}
+        return {}
+
+    @staticmethod
+    def set_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    async def get_session(self):
+        async with self.sessionmaker() as session:
+            yield session
+
+    async def setup(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        app.dependency_overrides[get_db_session] = self.get_session
+        worker.get_db_session = self.get_session
+        settings.task_duration_scale = 0
+
+    async def teardown(self):
+        app.dependency_overrides.clear()
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await self.engine.dispose()
+
+    def task_payload(self, index: int) -> dict:
+        return {
+            'name': f'bench-{index}',
+            'description': 'benchmark task',
+            'priority': self.random.choice(PRIORITIES),
+        }
+
+    async def bench_create(self, client: AsyncClient) -> Samples:
+        async def create(index: int):
+            response = await client.post(
+                '/api/v1/tasks', json=self.task_payload(index)
+            )
+            response.raise_for_status()
+            self.task_ids.append(response.json()['id'])
+
+        return await measure(
+            create, self.args.requests, self.args.concurrency
+        )
+
+    async def bench_batch_create(self, client: AsyncClient) -> Samples:
+        size = self.args.batch_size
+
+        async def create_batch(index: int) -> int:
+            payload = [
+                self.task_payload(index * size + offset)
+                for offset in range(size)
+            ]
+            response = await client.post('/api/v1/tasks:batch', json=payload)
+            response.raise_for_status()
+            items = response.json()['items']
+            self.task_ids.extend(item['task']['id'] for item in items)
+            return len(items)
+
+        requests = max(1, self.args.requests // size)
+        return await measure(create_batch, requests, self.args.concurrency)
+
+    async def bench_list(self, client: AsyncClient) -> Samples:
+        cursors: list[str | None] = [None]
+        while len(cursors) < self.args.requests:
+            response = await client.get(
+                '/api/v1/tasks', params=self.list_params(cursors[-1])
+            )
+            next_cursor = response.json()['next_cursor']
+            if not next_cursor:
+                break
+            cursors.append(next_cursor)
+
+        async def list_page(index: int):
+            cursor = cursors[index % len(cursors)]
+            response = await client.get(
+                '/api/v1/tasks', params=self.list_params(cursor)
+            )
+            response.raise_for_status()
+
+        return await measure(
+            list_page, self.args.requests, self.args.concurrency
+        )
+
+    @staticmethod
+    def list_params(cursor: str | None) -> dict:
+        return {'limit': 50, 'cursor': cursor} if cursor else {'limit': 50}
+
+    async def bench_status(self, client: AsyncClient) -> Samples:
+        async def poll(index: int):
+            task_id = self.random.choice(self.task_ids)
+            response = await client.get(f'/api/v1/tasks/{task_id}/status')
+            response.raise_for_status()
+
+        return await measure(poll, self.args.requests, self.args.concurrency)
+
+    async def bench_relay(self, client: AsyncClient) -> Samples:
+        async def drain(index: int) -> int:
+            async with self.sessionmaker() as session:
+                return await outbox_relay.relay_batch(session)
+
+        samples = Samples()
+        started = time.perf_counter()
+        while True:
+            start = time.perf_counter()
+            sent = await drain(0)
+            if not sent:
+                break
+            samples.latencies.append(time.perf_counter() - start)
+            samples.operations += sent
+        samples.elapsed = time.perf_counter() - started
+
+        return samples
+
+    async def bench_consume(self, client: AsyncClient) -> Samples:
+        total = await self.broker.queue_depth()
+        samples = Samples()
+        scheduler = PriorityScheduler(
+            self.broker,
+            self.args.concurrency,
+            prefetch=self.args.concurrency,
+        )
+
+        async def process(message):
+            start = time.perf_counter()
+            try:
+                await worker.handle_message(message)
+            finally:
+                scheduler.release(message)
+            samples.latencies.append(time.perf_counter() - start)
+            samples.operations += 1
+
+        started = time.perf_counter()
+        in_flight = []
+        async with scheduler:
+            for _ in range(total):
+                message = await scheduler.next()
+                in_flight.append(asyncio.create_task(process(message)))
+            await asyncio.gather(*in_flight)
+        samples.elapsed = time.perf_counter() - started
+
+        return samples
+
+    async def bench_instrumentation(self, client: AsyncClient) -> dict:
+        """Накладные расходы @timed на вызов, в микросекундах."""
+        calls = self.args.requests * 200
+
+        async def noop():
+            return None
+
+        instrumented = timed('benchmark')(noop)
+
+        async def loop(func) -> float:
+            start = time.perf_counter()
+            for _ in range(calls):
+                await func()
+            return time.perf_counter() - start
+
+        plain = min([await loop(noop) for _ in range(3)])
+        observed = min([await loop(instrumented) for _ in range(3)])
+
+        return {
+            'calls': calls,
+            'overhead_us': round((observed - plain) / calls * 1e6, 3),
+        }
+
+    async def run(self) -> dict:
+        await self.setup()
+        results = {}
+        try:
+            transport = ASGITransport(app=app)
+            async with AsyncClient(
+                transport=transport, base_url='http://bench'
+            ) as client:
+                for name in self.args.scenarios:
+                    scenario = getattr(self, f'bench_{name}')
+                    samples = await scenario(client)
+                    if isinstance(samples, dict):
+                        results[name] = samples
+                        print(f'{name:<14} {samples}')
+                    elif samples.latencies:
+                        results[name] = samples.summary()
+                        print_result(name, results[name])
+        finally:
+            await self.teardown()
+
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'database': self.engine.dialect.name,
+                'requests': self.args.requests,
+                'concurrency': self.args.concurrency,
+                'batch_size': self.args.batch_size,
+            },
+            'results': results,
+        }
+
+
+def print_result(name: str, result: dict):
+    print(
+        f"{name:<14} p50={result['p50_ms']:>9.2f}ms "
+        f"p95={result['p95_ms']:>9.2f}ms p99={result['p99_ms']:>9.2f}ms "
+        f"{result['ops_per_sec']:>10.1f} ops/s"
+    )
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Возвращает список регрессий относительно baseline."""
+    regressions = []
+    for name, current in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if 'overhead_us' in base:
+            if current['overhead_us'] > base['overhead_us'] * (1 + threshold):
+                regressions.append(
+                    f"{name}: overhead {current['overhead_us']}us > "
+                    f"baseline {base['overhead_us']}us"
+                )
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']}ms > "
+                f"baseline {base['p95_ms']}ms"
+            )
+        if current['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold):
+            regressions.append(
+                f"{name}: {current['ops_per_sec']} ops/s < "
+                f"baseline {base['ops_per_sec']} ops/s"
+            )
+
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument(
+        '--database-url',
+        help='Defaults to a temporary SQLite file; a local Postgres URL '
+        '(postgresql+asyncpg://...) may be used instead. Tables are '
+        'dropped and recreated.',
+    )
+    parser.add_argument(
+        '--scenarios',
+        default=','.join(SCENARIOS),
+        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument('--output', help='Write results JSON here.')
+    parser.add_argument('--baseline', help='Baseline results JSON.')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='Allowed relative regression against the baseline.',
+    )
+    args = parser.parse_args()
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.database_url:
+            args.database_url = f'sqlite+aiosqlite:///{tmp}/bench.db'
+        results = asyncio.run(Benchmark(args).run())
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
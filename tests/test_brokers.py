@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from app.brokers.base import DEAD_LETTER_QUEUE, PRIORITY_QUEUES
+from app.brokers.memory import MemoryBroker
+
+HIGH, MEDIUM, LOW = (PRIORITY_QUEUES[p] for p in (3, 2, 1))
+
+
+async def take(messages, count):
+    return [await anext(messages) for _ in range(count)]
+
+
+def task_ids(received):
+    return [json.loads(message.body)['task_id'] for message in received]
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_routes_by_priority():
+    broker = MemoryBroker()
+    await broker.publish_batch([('low', 1), ('high', 3), ('mid', 2)])
+    await broker.publish('high-2', 3)
+    assert await broker.queue_depth() == 4
+
+    received = await take(broker.consume(10, HIGH), 2)
+    assert task_ids(received) == ['high', 'high-2']
+    assert [message.queue for message in received] == [HIGH, HIGH]
+    assert await broker.queue_depth(MEDIUM) == 1
+    assert await broker.queue_depth(LOW) == 1
+    assert await broker.queue_depth() == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_respects_prefetch():
+    broker = MemoryBroker()
+    await broker.publish_batch([(str(i), 1) for i in range(3)])
+    messages = broker.consume(2, LOW)
+
+    first, second = await take(messages, 2)
+    pending = asyncio.ensure_future(anext(messages))
+    await asyncio.sleep(0)
+    assert not pending.done()
+
+    await second.ack(multiple=True)
+    third = await asyncio.wait_for(pending, timeout=1)
+    assert task_ids([first, second, third]) == ['0', '1', '2']
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_requeues_on_failure():
+    broker = MemoryBroker()
+    await broker.publish('retry', 1)
+    messages = broker.consume(1, LOW)
+
+    message = await anext(messages)
+    with pytest.raises(RuntimeError):
+        async with message.process(requeue=True):
+            raise RuntimeError('boom')
+
+    redelivered = await asyncio.wait_for(anext(messages), timeout=1)
+    assert task_ids([redelivered]) == ['retry']
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_dead_letters_rejected_messages():
+    broker = MemoryBroker()
+    await broker.publish('poison', 1)
+    messages = broker.consume(1, LOW)
+
+    message = await anext(messages)
+    with pytest.raises(ValueError):
+        async with message.process():
+            raise ValueError('bad payload')
+
+    assert await broker.queue_depth() == 0
+    assert await broker.queue_depth(DEAD_LETTER_QUEUE) == 1
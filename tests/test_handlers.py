@@ -0,0 +1,91 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.services.handlers import Executor, HandlerRegistry
+
+
+def total(payload):
+    return {'sum': sum(payload['values'])}
+
+
+def thread_name(payload):
+    return threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_handlers_run_in_their_executors(monkeypatch):
+    # payload больше порога уходит в процесс через shared memory
+    monkeypatch.setattr(settings, 'handler_shared_memory_threshold', 1024)
+    monkeypatch.setattr(settings, 'handler_process_pool_size', 1)
+    registry = HandlerRegistry()
+    registry.register('sum', Executor.PROCESS)(total)
+    registry.register('thread', Executor.THREAD)(thread_name)
+
+    try:
+        small = await registry.run('sum', {'values': [1, 2, 3]})
+        large = await registry.run('sum', {'values': list(range(10000))})
+        name = await registry.run('thread', None)
+    finally:
+        registry.shutdown()
+
+    assert json.loads(small) == {'sum': 6}
+    assert json.loads(large) == {'sum': sum(range(10000))}
+    assert name.startswith('task-handler')
+
+
+@pytest.mark.asyncio
+async def test_handler_concurrency_limit_per_type(monkeypatch):
+    monkeypatch.setattr(settings, 'task_type_concurrency', {'limited': 1})
+    registry = HandlerRegistry()
+    running = 0
+    peak = 0
+
+    @registry.register('limited', concurrency=5)
+    async def limited(payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(registry.run('limited', None) for _ in range(3)))
+
+    # настройка TASK_TYPE_CONCURRENCY важнее значения из регистрации
+    assert peak == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_thread_handler_keeps_capacity():
+    registry = HandlerRegistry()
+    release = threading.Event()
+    started = []
+
+    @registry.register('blocking', Executor.THREAD, concurrency=1)
+    def blocking(payload):
+        started.append(payload)
+        release.wait(timeout=5)
+
+    try:
+        first = asyncio.create_task(registry.run('blocking', 1))
+        while not started:
+            await asyncio.sleep(0.01)
+        first.cancel()
+        second = asyncio.create_task(registry.run('blocking', 2))
+        await asyncio.sleep(0.05)
+
+        # поток ещё работает: отмена не вернула ни задачу, ни семафор
+        assert not first.done()
+        assert started == [1]
+
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, timeout=1)
+        assert started == [1, 2]
+    finally:
+        release.set()
+        registry.shutdown()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+import httpx
+import pytest
+
+from app.core.lifecycle import InFlight
+from app.core.metrics import PUBLISHES_IN_FLIGHT
+from app.db.database import Database
+
+
+@pytest.mark.asyncio
+async def test_warm_up_fills_pool(tmp_path):
+    database = Database(f'sqlite+aiosqlite:///{tmp_path}/warm.db')
+
+    assert await database.warm_up(3) == 3
+    # соединения открыты и ждут в пуле
+    assert database.engine.pool.checkedin() == 3
+    await database.dispose()
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_in_flight_operations():
+    in_flight = InFlight(PUBLISHES_IN_FLIGHT)
+    release = asyncio.Event()
+
+    async def operation():
+        with in_flight.track():
+            await release.wait()
+
+    running = asyncio.create_task(operation())
+    await asyncio.sleep(0)
+    assert not await in_flight.drain(timeout=0.01)
+
+    release.set()
+    assert await in_flight.drain(timeout=1)
+    await running
+
+
+SERVER = """
+import asyncio
+import sys
+
+import uvicorn
+
+from app import main
+from app.core.config import settings
+from app.db.database import Base, database
+
+# задачи остаются PENDING: long-poll и поток ждут событий
+main.start_embedded_workers = lambda: []
+settings.broker_backend = 'memory'
+settings.notification_backend = 'local'
+database.url = sys.argv[1]
+
+
+async def create_tables():
+    async with database.connect().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+asyncio.run(create_tables())
+uvicorn.run(main.app, host='127.0.0.1', port=int(sys.argv[2]))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_sigterm_ends_streams_and_stops_server(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            '-c',
+            SERVER,
+            f'sqlite+aiosqlite:///{tmp_path}/lifespan.db',
+            str(port),
+        ],
+        cwd=root,
+        start_new_session=True,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+            for _ in range(100):
+                try:
+                    response = await client.post(
+                        '/api/v1/tasks', json={'name': 'Open'}
+                    )
+                    break
+                except httpx.ConnectError:
+                    await asyncio.sleep(0.1)
+            task_id = response.json()['id']
+
+            long_poll = asyncio.create_task(
+                client.get(
+                    f'/api/v1/tasks/{task_id}/status', params={'wait': '60s'}
+                )
+            )
+            async with client.stream(
+                'GET', f'/api/v1/tasks/{task_id}/events'
+            ) as stream:
+                lines = stream.aiter_lines()
+                assert (await anext(lines)) == 'event: status'
+                await asyncio.sleep(0.2)
+
+                # uvicorn ждёт открытые соединения до остановки lifespan:
+                # без завершения по сигналу поток и long-poll её держат
+                server.send_signal(signal.SIGTERM)
+                rest = [line async for line in lines]
+
+            assert 'keep-alive' not in ''.join(rest)
+            response = await asyncio.wait_for(long_poll, timeout=5)
+            assert response.json()['status'] == 'PENDING'
+
+        # uvicorn после остановки повторяет перехваченный сигнал
+        code = await asyncio.to_thread(server.wait, 10)
+        assert code in (0, -signal.SIGTERM)
+    finally:
+        if server.poll() is None:
+            os.killpg(server.pid, signal.SIGKILL)
+            server.wait()
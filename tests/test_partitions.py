@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+from app.services.partitions import (
+    Partition,
+    months_to_create,
+    parse_bound,
+    parse_partition,
+)
+
+
+def utc(year, month, day=1):
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+def test_parse_partition_bounds():
+    partition = parse_partition(
+        'tasks_p2026_12',
+        "FOR VALUES FROM ('2026-12-01 00:00:00+00') "
+        "TO ('2027-01-01 00:00:00+00')",
+    )
+    assert (partition.lower, partition.upper) == (utc(2026, 12), utc(2027, 1))
+
+    legacy = parse_partition(
+        'tasks_legacy',
+        "FOR VALUES FROM (MINVALUE) TO ('2026-11-01 00:00:00+00')",
+    )
+    assert (legacy.lower, legacy.upper) == (None, utc(2026, 11))
+    assert parse_partition('tasks_default', 'DEFAULT').is_default
+
+
+def test_parse_bound_accepts_postgres_timestamp_format():
+    # формат pg_get_expr; fromisoformat в Python 3.10 его не разбирает
+    assert parse_bound("'2026-12-01 00:00:00+00'") == utc(2026, 12)
+    assert parse_bound("'2026-12-01 03:00:00.5+03'") == datetime(
+        2026, 12, 1, 0, 0, 0, 500000, tzinfo=timezone.utc
+    )
+    assert parse_bound("'2026-12-01 00:00:00-05:30'").utcoffset() == (
+        -timedelta(hours=5, minutes=30)
+    )
+    assert parse_bound('MINVALUE') is None
+
+
+def test_months_to_create_skips_covered_ranges():
+    partitions = [
+        Partition('tasks_legacy', None, utc(2026, 11)),
+        Partition('tasks_p2026_11', utc(2026, 11), utc(2026, 12)),
+        Partition('tasks_default', None, None, is_default=True),
+    ]
+
+    months = months_to_create(partitions, utc(2026, 10, 18), months_ahead=3)
+
+    assert months == [utc(2026, 12), utc(2027, 1)]
+    assert months_to_create([], utc(2026, 12, 31), 1) == [
+        utc(2026, 12),
+        utc(2027, 1),
+    ]
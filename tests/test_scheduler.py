@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.brokers.base import encode_task
+from app.brokers.memory import MemoryBroker
+from app.services.scheduler import PriorityScheduler
+
+WEIGHTS = {3: 3, 2: 2, 1: 1}
+
+
+async def buffered(scheduler, count):
+    while sum(len(b) for b in scheduler.buffers.values()) < count:
+        await asyncio.sleep(0)
+
+
+def task_ids(messages):
+    return [json.loads(message.body)['task_id'] for message in messages]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_shares_slots_by_weight():
+    broker = MemoryBroker()
+    await broker.publish_batch(
+        [(f'high-{i}', 3) for i in range(20)]
+        + [(f'low-{i}', 1) for i in range(20)]
+    )
+    scheduler = PriorityScheduler(
+        broker, 100, 100, WEIGHTS, reserved_high=0, aging_interval=0
+    )
+
+    async with scheduler:
+        await buffered(scheduler, 40)
+        picked = [scheduler.poll() for _ in range(8)]
+
+    priorities = [message.priority for message in picked]
+    assert priorities.count(3) == 6
+    assert priorities.count(1) == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reserves_slots_for_high():
+    broker = MemoryBroker()
+    await broker.publish_batch([(f'low-{i}', 1) for i in range(3)])
+    scheduler = PriorityScheduler(
+        broker, 3, 10, WEIGHTS, reserved_high=2, aging_interval=0
+    )
+
+    async with scheduler:
+        await buffered(scheduler, 3)
+        first = scheduler.poll()
+        assert scheduler.poll() is None
+
+        await broker.publish('high', 3)
+        high = await asyncio.wait_for(scheduler.next(), timeout=1)
+        assert task_ids([first, high]) == ['low-0', 'high']
+
+        scheduler.release(first)
+        assert task_ids([scheduler.poll()]) == ['low-1']
+
+
+@pytest.mark.asyncio
+async def test_scheduler_ages_old_tasks_up():
+    broker = MemoryBroker()
+    broker.put(encode_task('old-low'), 1, time.time() - 25)
+    await broker.publish('high', 3)
+    scheduler = PriorityScheduler(
+        broker, 10, 10, WEIGHTS, reserved_high=0, aging_interval=10
+    )
+
+    async with scheduler:
+        await buffered(scheduler, 2)
+        picked = [scheduler.poll(), scheduler.poll()]
+
+    # поднялась до HIGH и старше задачи HIGH
+    assert task_ids(picked) == ['old-low', 'high']
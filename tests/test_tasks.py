@@ -1,6 +1,12 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
 import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event, func, select, update
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -8,9 +14,21 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.pool import StaticPool
 
+from app.brokers.base import DEAD_LETTER_QUEUE, PRIORITY_QUEUES
+from app.brokers.memory import MemoryBroker
+from app.core.config import settings
 from app.db.database import Base
 from app.db.session import get_db_session
 from app.main import app
+from app.models.idempotency import TaskIdempotencyKey
+from app.models.outbox import OutboxMessage
+from app.models.task import ArchivedTask, Task, TaskPriority, TaskStatus
+from app.repositories.task import TaskRepository
+from app.services import batch_consumer, outbox_relay, task_service, worker
+from app.services.handlers import Executor, handlers
+from app.services.leases import LEASE_EXPIRED, leases, reap_expired
+from app.services.notifications import notifier
+from app.services.task_events import task_events
 
 TEST_DATABASE_URL = 'sqlite+aiosqlite:///:memory:'
 engine = create_async_engine(
@@ -52,6 +70,14 @@ async def client(db_session):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def handler_registry(monkeypatch):
+    """Обработчики, зарегистрированные в тесте, удаляются после него."""
+    monkeypatch.setattr(handlers, '_handlers', dict(handlers._handlers))
+    monkeypatch.setattr(handlers, '_limits', dict(handlers._limits))
+    return handlers
+
+
 @pytest.mark.asyncio
 async def test_create_task(client):
     payload = {
@@ -67,6 +93,66 @@ async def test_create_task(client):
     assert data['priority'] == payload['priority']
 
 
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key(client, db_session):
+    payload = {'name': 'Idempotent Task', 'priority': 'HIGH'}
+    headers = {'Idempotency-Key': f'key-{uuid4()}'}
+
+    created = await client.post('/api/v1/tasks', json=payload, headers=headers)
+    replayed = await client.post(
+        '/api/v1/tasks', json=payload, headers=headers
+    )
+    assert created.status_code == 201
+    assert replayed.status_code == 200
+    assert replayed.headers['Idempotent-Replayed'] == 'true'
+    task_id = created.json()['id']
+    assert replayed.json()['id'] == task_id
+    # повтор не публикуется второй раз
+    published = await db_session.scalar(
+        select(func.count())
+        .select_from(OutboxMessage)
+        .where(OutboxMessage.task_id == UUID(task_id))
+    )
+    assert published == 1
+
+    changed = await client.post(
+        '/api/v1/tasks', json={**payload, 'name': 'Other'}, headers=headers
+    )
+    assert changed.status_code == 422
+
+    # истёкший ключ, ещё не удалённый обслуживанием, занимается заново
+    await db_session.execute(
+        update(TaskIdempotencyKey)
+        .where(TaskIdempotencyKey.key == headers['Idempotency-Key'])
+        .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    )
+    await db_session.commit()
+    recreated = await client.post(
+        '/api/v1/tasks', json=payload, headers=headers
+    )
+    assert recreated.status_code == 201
+    assert recreated.json()['id'] != task_id
+
+
+@pytest.mark.asyncio
+async def test_unknown_task_type_is_rejected(client):
+    response = await client.post(
+        '/api/v1/tasks', json={'name': 'Task', 'type': 'no-such-handler'}
+    )
+    assert response.status_code == 422
+    assert 'no-such-handler' in response.json()['detail']
+
+    response = await client.post(
+        '/api/v1/tasks:batch',
+        json=[{'name': 'Known'}, {'name': 'Task', 'type': 'no-such-handler'}],
+    )
+    assert response.status_code == 201
+    known, unknown = response.json()['items']
+    assert known['success']
+    assert not unknown['success']
+    assert 'no-such-handler' in unknown['error']
+
+
 @pytest.mark.asyncio
 async def test_get_tasks(client):
     payload = {
@@ -95,3 +181,706 @@ async def test_get_task_with_invalid_id(client):
 
     assert response.status_code == 404
     assert response.json() == {'detail': 'Task not found'}
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_keyset_pagination(client, db_session):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    created = [
+        Task(name=f'Paged {i}', created_at=base + timedelta(minutes=i))
+        for i in range(5)
+    ]
+    db_session.add_all(created)
+    await db_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 2, 'include_total': True}
+        if cursor:
+            params['cursor'] = cursor
+        response = await client.get('/api/v1/tasks', params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data['items']) <= 2
+        assert data['total'] >= 5
+        seen.extend(data['items'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    ids = [item['id'] for item in seen]
+    assert len(ids) == len(set(ids))
+    assert {str(t.id) for t in created} <= set(ids)
+    stamps = [item['created_at'] for item in seen]
+    assert stamps == sorted(stamps, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_invalid_cursor(client):
+    response = await client.get('/api/v1/tasks', params={'cursor': 'bogus'})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_tasks_batch(client):
+    payload = [
+        {'name': 'Batch 1', 'priority': 'HIGH'},
+        {'name': 'Batch 2', 'priority': 'URGENT'},
+        {'name': 'Batch 3', 'priority': 'LOW'},
+    ]
+    response = await client.post('/api/v1/tasks:batch', json=payload)
+
+    assert response.status_code == 201
+    items = response.json()['items']
+    assert [item['index'] for item in items] == [0, 1, 2]
+    assert [item['success'] for item in items] == [True, False, True]
+    assert items[0]['task']['status'] == 'PENDING'
+    assert items[1]['task'] is None
+    assert items[1]['error'].startswith('priority')
+
+
+@pytest.mark.asyncio
+async def test_outbox_relay_publishes_created_tasks(
+    client, db_session, monkeypatch
+):
+    broker = MemoryBroker()
+    monkeypatch.setattr(outbox_relay, 'get_broker', lambda: broker)
+    response = await client.post('/api/v1/tasks', json={'name': 'Relayed'})
+    task_id = response.json()['id']
+
+    while await outbox_relay.relay_batch(db_session):
+        pass
+
+    published = []
+    queue = broker.queues[PRIORITY_QUEUES[TaskPriority.MEDIUM.numeric]]
+    while not queue.empty():
+        priority, _, body = queue.get_nowait()
+        published.append((json.loads(body)['task_id'], priority))
+    assert (task_id, TaskPriority.MEDIUM.numeric) in published
+    unsent = await db_session.execute(
+        select(OutboxMessage).where(OutboxMessage.sent_at.is_(None))
+    )
+    assert unsent.scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_cancel_task_only_once(client):
+    response = await client.post('/api/v1/tasks', json={'name': 'Cancel me'})
+    task_id = response.json()['id']
+
+    response = await client.delete(f'/api/v1/tasks/{task_id}')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'CANCELLED'
+
+    response = await client.delete(f'/api/v1/tasks/{task_id}')
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_cancel_interrupts_running_task(
+    client, db_session, monkeypatch, handler_registry
+):
+    started = asyncio.Event()
+
+    @handler_registry.register('endless')
+    async def endless(payload):
+        started.set()
+        await asyncio.Event().wait()
+
+    response = await client.post(
+        '/api/v1/tasks', json={'name': 'Long', 'type': 'endless'}
+    )
+    task_id = response.json()['id']
+
+    running = asyncio.create_task(
+        task_service.process_task(db_session, task_id)
+    )
+    await asyncio.wait_for(started.wait(), timeout=1)
+    response = await client.delete(f'/api/v1/tasks/{task_id}')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'CANCELLED'
+    await asyncio.wait_for(running, timeout=1)
+
+    async def no_session():
+        raise AssertionError('cancelled task must not touch the database')
+        yield
+
+    monkeypatch.setattr(worker, 'get_db_session', no_session)
+    broker = MemoryBroker()
+    await broker.publish(task_id, 2)
+    message = await anext(broker.consume(1, PRIORITY_QUEUES[2]))
+    await worker.handle_message(message)
+    assert await broker.queue_depth(DEAD_LETTER_QUEUE) == 0
+
+
+@pytest.mark.asyncio
+async def test_reaper_requeues_tasks_with_expired_leases(client, db_session):
+    response = await client.post(
+        '/api/v1/tasks:batch',
+        json=[
+            {'name': 'Orphaned'},
+            {'name': 'Orphaned poison', 'max_attempts': 1},
+            {'name': 'Alive'},
+        ],
+    )
+    orphan, poison, alive = (
+        UUID(item['task']['id']) for item in response.json()['items']
+    )
+    repo = TaskRepository(db_session)
+    await repo.update_status_many(
+        [orphan, poison],
+        TaskStatus.IN_PROGRESS,
+        attempts=Task.attempts + 1,
+        worker_id='crashed',
+        lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+    )
+    await repo.update_status(
+        alive,
+        TaskStatus.IN_PROGRESS,
+        worker_id=leases.worker_id,
+        lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+    )
+    await db_session.commit()
+
+    with leases.hold(alive):
+        assert await leases.renew(db_session) == 1
+    assert await reap_expired(db_session, 100) >= 2
+
+    tasks = {
+        task_id: (await client.get(f'/api/v1/tasks/{task_id}')).json()
+        for task_id in (orphan, poison, alive)
+    }
+    assert tasks[orphan]['status'] == 'PENDING'
+    assert tasks[orphan]['error'] == LEASE_EXPIRED
+    assert tasks[poison]['status'] == 'FAILED'
+    assert tasks[alive]['status'] == 'IN_PROGRESS'
+    requeued = await db_session.scalar(
+        select(OutboxMessage).where(
+            OutboxMessage.task_id == orphan, OutboxMessage.sent_at.is_(None)
+        )
+    )
+    assert requeued is not None
+
+
+@pytest.mark.asyncio
+async def test_update_status_is_compare_and_set(db_session):
+    task = Task(name='Raced', status=TaskStatus.PENDING)
+    db_session.add(task)
+    await db_session.commit()
+
+    repo = TaskRepository(db_session)
+    first = await repo.update_status(task.id, TaskStatus.IN_PROGRESS)
+    second = await repo.update_status(task.id, TaskStatus.IN_PROGRESS)
+    await db_session.commit()
+
+    assert first is not None and first.status == TaskStatus.IN_PROGRESS
+    assert second is None
+
+
+@pytest.mark.asyncio
+async def test_failed_task_retried_then_dead_lettered(
+    client, db_session, monkeypatch, handler_registry
+):
+    @handler_registry.register('flaky', Executor.THREAD)
+    def flaky(payload):
+        raise RuntimeError('transient')
+
+    broker = MemoryBroker()
+    monkeypatch.setattr(outbox_relay, 'get_broker', lambda: broker)
+    response = await client.post(
+        '/api/v1/tasks',
+        json={'name': 'Flaky', 'type': 'flaky', 'max_attempts': 2},
+    )
+    task_id = response.json()['id']
+    await outbox_relay.relay_batch(db_session)
+
+    await task_service.process_task(db_session, task_id)
+    task = (await client.get(f'/api/v1/tasks/{task_id}')).json()
+    assert (task['status'], task['attempts']) == ('PENDING', 1)
+    retry = await db_session.scalar(
+        select(OutboxMessage).where(
+            OutboxMessage.task_id == UUID(task_id),
+            OutboxMessage.sent_at.is_(None),
+        )
+    )
+    assert retry.available_at.replace(tzinfo=timezone.utc) > datetime.now(
+        timezone.utc
+    )
+
+    await task_service.process_task(db_session, task_id)
+    response = await client.get('/api/v1/tasks:dead-letter')
+    dead = {item['id']: item for item in response.json()['items']}
+    assert dead[task_id]['attempts'] == 2
+    assert dead[task_id]['error'] == 'transient'
+
+    response = await client.post(f'/api/v1/tasks/{task_id}:redrive')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'PENDING'
+    assert response.json()['attempts'] == 0
+
+    response = await client.post(f'/api/v1/tasks/{task_id}:redrive')
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_archived_tasks_are_read_transparently(client, db_session):
+    created_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    archived = ArchivedTask(
+        id=uuid4(),
+        name='Archived',
+        priority=TaskPriority.LOW,
+        status=TaskStatus.COMPLETED,
+        created_at=created_at,
+        result='Success',
+    )
+    db_session.add(archived)
+    await db_session.commit()
+
+    response = await client.get(f'/api/v1/tasks/{archived.id}')
+    assert response.status_code == 200
+    assert response.json()['result'] == 'Success'
+
+    response = await client.get(f'/api/v1/tasks/{archived.id}/status')
+    assert response.json()['status'] == 'COMPLETED'
+
+    seen = []
+    params = {'limit': 2, 'status': 'COMPLETED'}
+    while True:
+        page = (await client.get('/api/v1/tasks', params=params)).json()
+        seen.extend(item['id'] for item in page['items'])
+        if not page['next_cursor']:
+            break
+        params['cursor'] = page['next_cursor']
+    assert seen[-1] == str(archived.id)
+
+    response = await client.get(
+        '/api/v1/tasks', params={'status': 'PENDING', 'limit': 500}
+    )
+    assert str(archived.id) not in {i['id'] for i in response.json()['items']}
+
+
+@pytest.mark.asyncio
+async def test_batch_status_lookup(client):
+    response = await client.post(
+        '/api/v1/tasks:batch',
+        json=[{'name': 'Polled 1'}, {'name': 'Polled 2'}],
+    )
+    first, second = (item['task']['id'] for item in response.json()['items'])
+    missing = str(uuid4())
+
+    response = await client.post(
+        '/api/v1/tasks/status:batch', json={'ids': [first, second, missing]}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert {item['id']: item['status'] for item in body['items']} == {
+        first: 'PENDING',
+        second: 'PENDING',
+    }
+    assert body['unknown'] == [missing]
+
+    await client.delete(f'/api/v1/tasks/{second}')
+    response = await client.post(
+        '/api/v1/tasks/status:batch',
+        json={'ids': [first, second, missing], 'since': body['as_of']},
+    )
+    body = response.json()
+    # first создана в пределах окна перекрытия и приходит повторно
+    assert {i['id']: i['status'] for i in body['items']} == {
+        first: 'PENDING',
+        second: 'CANCELLED',
+    }
+    assert body['unknown'] == [missing]
+
+    response = await client.post(
+        '/api/v1/tasks/status:batch', json={'ids': []}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_batch_status_keeps_changes_committed_after_read(
+    client, db_session
+):
+    response = await client.post('/api/v1/tasks', json={'name': 'Late'})
+    task_id = response.json()['id']
+    response = await client.post(
+        '/api/v1/tasks/status:batch', json={'ids': [task_id]}
+    )
+    as_of = response.json()['as_of']
+
+    # переход помечен до чтения опроса, а закоммичен после него
+    await db_session.execute(
+        update(Task)
+        .where(Task.id == UUID(task_id))
+        .values(
+            status=TaskStatus.IN_PROGRESS,
+            status_changed_at=datetime.now(timezone.utc)
+            - timedelta(seconds=1),
+        )
+    )
+    await db_session.commit()
+
+    response = await client.post(
+        '/api/v1/tasks/status:batch',
+        json={'ids': [task_id], 'since': as_of},
+    )
+    assert [(i['id'], i['status']) for i in response.json()['items']] == [
+        (task_id, 'IN_PROGRESS')
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stats_follow_creates_and_transitions(client, db_session):
+    since = datetime.now(timezone.utc) - timedelta(minutes=1)
+    before = (await client.get('/api/v1/tasks/stats')).json()
+
+    response = await client.post(
+        '/api/v1/tasks', json={'name': 'Counted', 'priority': 'HIGH'}
+    )
+    high_id = UUID(response.json()['id'])
+    response = await client.post(
+        '/api/v1/tasks:batch',
+        json=[{'name': 'Counted', 'priority': 'LOW'}] * 2,
+    )
+    low_id = response.json()['items'][0]['task']['id']
+    await client.delete(f'/api/v1/tasks/{low_id}')
+
+    repo = TaskRepository(db_session)
+    await repo.update_status(
+        high_id, TaskStatus.IN_PROGRESS, started_at=datetime.now(timezone.utc)
+    )
+    await repo.update_status(
+        high_id, TaskStatus.COMPLETED, completed_at=datetime.now(timezone.utc)
+    )
+    await db_session.commit()
+
+    response = await client.get(
+        '/api/v1/tasks/stats', params={'since': since.isoformat()}
+    )
+    assert response.status_code == 200
+    after = response.json()
+
+    def delta(priority, status):
+        return (
+            after['by_priority'][priority][status]
+            - before['by_priority'][priority][status]
+        )
+
+    assert delta('HIGH', 'PENDING') == 0
+    assert delta('HIGH', 'COMPLETED') == 1
+    assert delta('LOW', 'PENDING') == 1
+    assert delta('LOW', 'CANCELLED') == 1
+    assert after['total'] - before['total'] == 3
+    assert after['avg_wait_seconds'] is not None
+    assert after['avg_run_seconds'] is not None
+
+    counts = {}
+    for bucket in after['series']:
+        for name, value in bucket['counts'].items():
+            counts[name] = counts.get(name, 0) + value
+    assert counts['CREATED'] >= 3
+    assert counts['COMPLETED'] >= 1
+
+    response = await client.get(
+        '/api/v1/tasks/stats',
+        params={'since': '2000-01-01T00:00:00Z', 'bucket': 1},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_stats_written_once_per_transaction(client, db_session):
+    response = await client.post(
+        '/api/v1/tasks:batch', json=[{'name': 'Sharded'}] * 3
+    )
+    task_ids = [UUID(item['task']['id']) for item in response.json()['items']]
+
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        if 'task_counters' in statement and 'INSERT' in statement:
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        repo = TaskRepository(db_session)
+        for task_id in task_ids:
+            await repo.update_status(task_id, TaskStatus.CANCELLED)
+        assert statements == []
+        await db_session.commit()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    # дельты трёх переходов — один upsert в одном shard
+    assert len(statements) == 1
+    assert 'stats_pending' not in db_session.info
+
+
+@pytest.mark.asyncio
+async def test_batch_consumer_claims_and_completes_in_bulk(
+    client, db_session, monkeypatch
+):
+    async def session():
+        yield db_session
+
+    monkeypatch.setattr(settings, 'task_duration_scale', 0)
+    monkeypatch.setattr(batch_consumer, 'get_db_session', session)
+    broker = MemoryBroker()
+
+    response = await client.post(
+        '/api/v1/tasks:batch', json=[{'name': f'Bulk {i}'} for i in range(3)]
+    )
+    task_ids = [item['task']['id'] for item in response.json()['items']]
+    await broker.publish_batch([(task_id, 2) for task_id in task_ids])
+    await broker.publish(task_ids[0], 2)
+    broker.put(b'not json', 2)
+
+    consumer = batch_consumer.BatchConsumer(
+        broker, concurrency=4, batch_size=10, flush_size=100, flush_interval=60
+    )
+    messages = broker.consume(consumer.prefetch, PRIORITY_QUEUES[2])
+    batch = [await anext(messages) for _ in range(5)]
+    updates = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE TASKS'):
+            updates.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        await consumer.start_batch(batch)
+        await asyncio.gather(*consumer._in_flight)
+        assert len(consumer.completions) == 3
+        # до коммита сброса аренда буферизованных задач продлевается
+        assert {UUID(task_id) for task_id in task_ids} <= leases.held
+        await consumer.completions.flush()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    assert not {UUID(task_id) for task_id in task_ids} & leases.held
+
+    assert len(updates) == 2
+    for task_id in task_ids:
+        response = await client.get(f'/api/v1/tasks/{task_id}')
+        assert response.json()['status'] == 'COMPLETED'
+    assert consumer.acks.pending == 0
+    assert batch[0].consumer.unacked == {}
+    assert list(broker.dead_letters) == [b'not json']
+
+
+@pytest.mark.asyncio
+async def test_export_streams_ndjson_and_csv(client, monkeypatch):
+    monkeypatch.setattr(settings, 'export_chunk_size', 2)
+    created_from = datetime.now(timezone.utc).isoformat()
+    response = await client.post(
+        '/api/v1/tasks:batch',
+        json=[{'name': f'Export {i}', 'description': 'd'} for i in range(5)],
+    )
+    task_ids = {item['task']['id'] for item in response.json()['items']}
+    params = {'created_from': created_from, 'status': 'PENDING'}
+
+    response = await client.get(
+        '/api/v1/tasks/export', params={**params, 'fields': 'description'}
+    )
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert {row['id'] for row in rows} == task_ids
+    assert {row['description'] for row in rows} == {'d'}
+
+    response = await client.get(
+        '/api/v1/tasks/export', params={**params, 'format': 'csv'}
+    )
+    assert response.headers['content-type'].startswith('text/csv')
+    header, *lines = response.text.splitlines()
+    assert header.split(',')[:2] == ['id', 'name']
+    assert {line.split(',')[0] for line in lines} == task_ids
+
+    response = await client.get(
+        '/api/v1/tasks/export', params={'format': 'xml'}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_task_status_cache_invalidated_on_transition(client):
+    response = await client.post('/api/v1/tasks', json={'name': 'Cached'})
+    task_id = response.json()['id']
+
+    before = (await client.get('/api/v1/system/cache')).json()
+    await client.get(f'/api/v1/tasks/{task_id}/status')
+    response = await client.get(f'/api/v1/tasks/{task_id}/status')
+    assert response.json()['status'] == 'PENDING'
+    after = (await client.get('/api/v1/system/cache')).json()
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 1
+
+    await client.delete(f'/api/v1/tasks/{task_id}')
+    response = await client.get(f'/api/v1/tasks/{task_id}/status')
+    assert response.json()['status'] == 'CANCELLED'
+
+
+@pytest.mark.asyncio
+async def test_task_status_long_poll_wakes_on_change(client, db_session):
+    response = await client.post('/api/v1/tasks', json={'name': 'Awaited'})
+    task_id = response.json()['id']
+
+    poll = asyncio.create_task(
+        client.get(f'/api/v1/tasks/{task_id}/status', params={'wait': '5s'})
+    )
+    while task_events.subscriber_count == 0:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.01)
+    # ожидающий запрос не держит соединение с базой
+    assert not db_session.in_transaction()
+    notifier.dispatch(UUID(task_id), TaskStatus.IN_PROGRESS)
+
+    response = await asyncio.wait_for(poll, 1)
+    assert response.json() == {'id': task_id, 'status': 'IN_PROGRESS'}
+
+
+@pytest.mark.asyncio
+async def test_task_events_stream_ends_on_terminal_status(client):
+    response = await client.post('/api/v1/tasks', json={'name': 'Streamed'})
+    task_id = response.json()['id']
+    await client.delete(f'/api/v1/tasks/{task_id}')
+
+    response = await client.get(f'/api/v1/tasks/{task_id}/events')
+
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert response.text == (
+        'event: status\n'
+        f'data: {{"status":"CANCELLED","id":"{task_id}"}}\n\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_shutdown_ends_long_poll_and_event_stream(client, monkeypatch):
+    monkeypatch.setattr(task_events, 'closed', False)
+    response = await client.post('/api/v1/tasks', json={'name': 'Waiting'})
+    task_id = response.json()['id']
+
+    long_poll = asyncio.create_task(
+        client.get(f'/api/v1/tasks/{task_id}/status', params={'wait': '60s'})
+    )
+    stream = asyncio.create_task(
+        client.get(f'/api/v1/tasks/{task_id}/events')
+    )
+    while task_events.subscriber_count < 2:
+        await asyncio.sleep(0.01)
+
+    task_events.close()
+    long_poll, stream = await asyncio.wait_for(
+        asyncio.gather(long_poll, stream), timeout=1
+    )
+
+    assert long_poll.json()['status'] == 'PENDING'
+    assert stream.text == (
+        'event: status\n'
+        f'data: {{"status":"PENDING","id":"{task_id}"}}\n\n'
+    )
+    assert task_events.subscriber_count == 0
+
+
+@pytest.mark.asyncio
+async def test_event_stream_ends_after_max_duration(client, monkeypatch):
+    monkeypatch.setattr(settings, 'sse_max_duration', 0.05)
+    response = await client.post('/api/v1/tasks', json={'name': 'Capped'})
+    task_id = response.json()['id']
+
+    response = await asyncio.wait_for(
+        client.get(f'/api/v1/tasks/{task_id}/events'), timeout=1
+    )
+
+    assert response.text == (
+        'event: status\n'
+        f'data: {{"status":"PENDING","id":"{task_id}"}}\n\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_omits_large_fields_by_default(client):
+    await client.post(
+        '/api/v1/tasks', json={'name': 'Projected', 'description': 'Big'}
+    )
+
+    response = await client.get('/api/v1/tasks', params={'limit': 1})
+    assert response.json()['items'][0]['description'] is None
+
+    response = await client.get(
+        '/api/v1/tasks', params={'limit': 1, 'fields': 'description'}
+    )
+    assert response.json()['items'][0]['description'] == 'Big'
+
+    response = await client.get('/api/v1/tasks', params={'fields': 'secret'})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_api_queries_are_index_backed(client):
+    response = await client.post('/api/v1/tasks', json={'name': 'Explained'})
+    task_id = response.json()['id']
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ('SELECT', 'UPDATE') and 'tasks' in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        page = await client.get('/api/v1/tasks', params={'limit': 1})
+        await client.get(
+            '/api/v1/tasks',
+            params={'limit': 1, 'cursor': page.json()['next_cursor']},
+        )
+        page = await client.get(
+            '/api/v1/tasks', params={'limit': 1, 'status': 'PENDING'}
+        )
+        await client.get(
+            '/api/v1/tasks',
+            params={
+                'limit': 1,
+                'status': 'PENDING',
+                'cursor': page.json()['next_cursor'],
+            },
+        )
+        await client.get(f'/api/v1/tasks/{task_id}')
+        await client.get(f'/api/v1/tasks/{task_id}/status')
+        await client.delete(f'/api/v1/tasks/{task_id}')
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    assert len(statements) >= 7
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = await conn.exec_driver_sql(
+                f'EXPLAIN QUERY PLAN {statement}', parameters
+            )
+            details = [row[-1] for row in plan]
+            assert details, statement
+            if 'WHERE' in statement:
+                # только первая страница без фильтров читает индекс с начала
+                assert details[0].startswith('SEARCH'), (statement, details)
+            for detail in details:
+                assert 'TEMP B-TREE' not in detail, (statement, details)
+                if detail.startswith('SCAN'):
+                    assert 'INDEX' in detail, (statement, details)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    await client.get('/api/v1/tasks/00000000-0000-0000-0000-000000000000')
+
+    response = await client.get('/metrics')
+
+    assert response.status_code == 200
+    body = response.text
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/api/v1/tasks/{task_id}",status="404"}'
+    ) in body
+    assert 'repository_call_duration_seconds_count{method="get",' in body
+    assert 'db_pool_checked_out' in body
+    assert 'task_cache_hits' in body
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import worker
+from app.services.batch_consumer import AckTracker
+
+
+class FakeMessage:
+    def __init__(self, task_id, events):
+        self.body = json.dumps({'task_id': task_id}).encode()
+        self.events = events
+
+    @asynccontextmanager
+    async def process(self):
+        yield
+        self.events.append(('ack', json.loads(self.body)['task_id']))
+
+
+@pytest.mark.asyncio
+async def test_handle_message_acks_after_processing(monkeypatch):
+    events = []
+
+    async def fake_session():
+        yield None
+
+    async def fake_process_task(session, task_id):
+        await asyncio.sleep(0)
+        events.append(('commit', task_id))
+
+    monkeypatch.setattr(worker, 'get_db_session', fake_session)
+    monkeypatch.setattr(worker, 'process_task', fake_process_task)
+
+    await asyncio.gather(
+        worker.handle_message(FakeMessage('a', events)),
+        worker.handle_message(FakeMessage('b', events)),
+    )
+
+    for task_id in ('a', 'b'):
+        assert events.index(('commit', task_id)) < events.index(
+            ('ack', task_id)
+        )
+
+
+class TaggedMessage:
+    queue = 'tasks_queue.medium'
+
+    def __init__(self, delivery_tag, events):
+        self.delivery_tag = delivery_tag
+        self.events = events
+
+    async def ack(self, multiple=False):
+        self.events.append(('ack', self.delivery_tag, multiple))
+
+    async def nack(self, requeue=True):
+        self.events.append(('nack', self.delivery_tag, requeue))
+
+
+@pytest.mark.asyncio
+async def test_ack_tracker_acks_contiguous_prefix():
+    events = []
+    acks = AckTracker()
+    messages = [TaggedMessage(tag, events) for tag in range(1, 6)]
+    for message in messages:
+        acks.track(message)
+
+    await acks.settle([messages[1], messages[2]])
+    assert events == []
+
+    await acks.reject([messages[3]], requeue=False)
+    await acks.settle([messages[0]])
+    assert events == [('nack', 4, False), ('ack', 3, True)]
+
+    await acks.settle([messages[4]])
+    assert events[-1] == ('ack', 5, True)
+    assert acks.pending == 0
+
+
+SUPERVISED = """
+import asyncio
+import os
+from app.services import worker
+
+async def main(concurrency, batch_size):
+    os.write(1, b'started\\n')
+    await asyncio.Event().wait()
+
+worker.settings.worker_metrics_port = 0
+worker.main = main
+worker.supervise(1, 0, processes=2)
+"""
+
+
+def test_supervisor_stops_workers_on_sigterm():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    supervisor = subprocess.Popen(
+        [sys.executable, '-c', SUPERVISED],
+        cwd=root,
+        stdout=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    try:
+        # второй воркер может ещё запускаться: сигнал приходит в любой
+        # момент старта
+        assert supervisor.stdout.readline().strip() == 'started'
+
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(timeout=10) == 0
+    finally:
+        if supervisor.poll() is None:
+            # вместе с воркерами
+            os.killpg(supervisor.pid, signal.SIGKILL)
+            supervisor.wait()
+        supervisor.stdout.close()